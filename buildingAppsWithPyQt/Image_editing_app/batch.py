@@ -0,0 +1,103 @@
+# Headless batch mode: apply a chain of Editor filters to every image in a folder
+# run with: python batch.py FOLDER --filters Left,Contrast,Sharpen
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from PIL import Image
+from filters import transformations, is_image_file, apply_operations, save_atomic, upright, editable, ENHANCE_FACTOR
+from jpeg_orientation import is_jpeg, is_geometric, rotate_jpeg
+from frames import is_multiframe, process_frames
+
+# images in a folder that the batch can work on
+def find_images(folder):
+    results = []
+    for entry in sorted(os.scandir(folder), key=lambda entry: entry.name):
+        if entry.is_file() and is_image_file(entry.name) and not entry.name.lower().endswith(".svg"):
+            results.append(entry.name)
+    return results
+
+# runs in a worker process: filter one file and write it next to the others in the output folder;
+# factors can set the enhance factor for "Color" and "Contrast"
+def process_file(source, target, operations, engine="pil", factors=None):
+    if is_geometric(operations) and is_jpeg(source):
+        return rotate_jpeg(source, target, operations) # lossless, only the EXIF orientation changes
+    if is_multiframe(source):
+        return process_frames(source, target, operations, workers=1, factors=factors) # already in a worker process
+    with Image.open(source) as image:
+        image = editable(upright(image)) # palette and 16-bit files become RGB/RGBA/L, as in the Editor
+        if engine == "numpy":
+            import numpy_filters # only needs NumPy when asked for
+            image = numpy_filters.apply_operations(image, operations, factors)
+        else:
+            image = apply_operations(image, operations, factors)
+        return save_atomic(image, target) # an interrupted run never leaves half a file behind
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Apply PhotoQt filters to a whole folder of images.")
+    parser.add_argument("folder", help="folder with the images to process")
+    parser.add_argument("--filters", required=True,
+                        help="comma separated filter chain, e.g. Left,Contrast,Sharpen (choose from: "
+                             + ", ".join(transformations) + ")")
+    parser.add_argument("--output", help="where to write the results (default: FOLDER/edits)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of worker processes")
+    parser.add_argument("--engine", choices=["pil", "numpy"], default="pil",
+                        help="run B/W, Color and Contrast with PIL (default) or NumPy")
+    parser.add_argument("--color", type=float, help=f"enhance factor for Color (default: {ENHANCE_FACTOR})")
+    parser.add_argument("--contrast", type=float, help=f"enhance factor for Contrast (default: {ENHANCE_FACTOR})")
+    parser.add_argument("--overwrite", action="store_true", help="redo files that are already in the output folder")
+    args = parser.parse_args(argv)
+    args.operations = [name.strip() for name in args.filters.split(",") if name.strip()]
+    unknown = [name for name in args.operations if name not in transformations]
+    if unknown:
+        parser.error("unknown filter(s): " + ", ".join(unknown))
+    args.factors = {name: factor for name, factor in (("Color", args.color), ("Contrast", args.contrast))
+                    if factor is not None}
+    if args.output is None:
+        args.output = os.path.join(args.folder, "edits")
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    os.makedirs(args.output, exist_ok=True)
+
+    # resume: anything already in the output folder was finished by an earlier run
+    filenames = find_images(args.folder)
+    todo = [name for name in filenames
+            if args.overwrite or not os.path.exists(os.path.join(args.output, name))]
+    skipped = len(filenames) - len(todo)
+    if skipped:
+        print(f"Skipping {skipped} file(s) already in {args.output}")
+    if not todo:
+        print("Nothing to do.")
+        return 0
+
+    done = 0
+    failed = 0
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = {pool.submit(process_file, os.path.join(args.folder, name),
+                               os.path.join(args.output, name), args.operations, args.engine, args.factors): name
+                   for name in todo}
+        try:
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                    done += 1
+                except Exception as error:
+                    failed += 1
+                    print(f"\nFailed: {futures[future]}: {error}", file=sys.stderr)
+                elapsed = time.perf_counter() - start
+                print(f"\r{done + failed}/{len(todo)} images, {done / elapsed:.1f} images/s", end="", flush=True)
+        except KeyboardInterrupt:
+            pool.shutdown(wait=False, cancel_futures=True)
+            print(f"\nInterrupted after {done} image(s); run again to resume.")
+            return 130
+
+    elapsed = time.perf_counter() - start
+    print(f"\nProcessed {done} image(s) in {elapsed:.1f}s ({done / elapsed:.1f} images/s), {failed} failed.")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
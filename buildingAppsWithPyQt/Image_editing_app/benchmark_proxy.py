@@ -0,0 +1,47 @@
+# Benchmark: click-to-display time with and without the preview proxy
+# run with: python benchmark_proxy.py
+import time
+from PIL import Image
+from filters import transformations, make_proxy
+
+# image sizes to test (megapixels) and the size of the picture box on screen
+SIZES = [1, 12, 40]
+DISPLAY_SIZE = (720, 680)
+FILTERS = ["B/W", "Color", "Contrast", "Blur", "Left", "Sharpen"]
+REPEATS = 3
+
+# make a noisy test image with roughly the given number of megapixels
+def make_image(megapixels):
+    width = int((megapixels * 1_000_000 * 4 / 3) ** 0.5)
+    height = int(width * 3 / 4)
+    return Image.effect_noise((width, height), 64).convert("RGB")
+
+# one "click": run the filter, then scale the result down to the picture box
+def click(image, filter_name):
+    result = transformations[filter_name](image)
+    shown = result.copy()
+    shown.thumbnail(DISPLAY_SIZE)
+    return shown
+
+def time_click(image, filter_name):
+    best = None
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        click(image, filter_name)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def main():
+    print(f"{'size':>6} {'filter':>9} {'full (ms)':>10} {'proxy (ms)':>11} {'speedup':>8}")
+    for megapixels in SIZES:
+        image = make_image(megapixels)
+        proxy = make_proxy(image)
+        for filter_name in FILTERS:
+            full_time = time_click(image, filter_name)
+            proxy_time = time_click(proxy, filter_name)
+            print(f"{megapixels:>4}MP {filter_name:>9} {full_time * 1000:>10.1f} "
+                  f"{proxy_time * 1000:>11.1f} {full_time / proxy_time:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
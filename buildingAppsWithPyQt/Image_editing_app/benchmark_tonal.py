@@ -0,0 +1,63 @@
+# Benchmark: B/W, Color and Contrast through PIL (ImageEnhance) against the NumPy engine
+# run with: python benchmark_tonal.py [megapixels ...]
+# Each measurement runs in its own process so the peak memory of one doesn't hide another.
+import os
+import sys
+import tempfile
+import time
+from multiprocessing import get_context
+from PIL import Image
+
+try:
+    import resource
+except ImportError: # Windows
+    resource = None
+
+SIZES = [1, 12, 50]
+CHAINS = [["B/W"], ["Color"], ["Contrast"], ["Color", "Contrast", "Color", "Contrast"]]
+FACTORS = {"Color": 1.5, "Contrast": 1.3}
+
+# peak memory of this process so far, in MB (None where it can't be read)
+def peak_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+# runs in a fresh process: load the test image, then time one chain with one engine
+def measure(path, engine, chain):
+    from numpy_filters import apply_operations
+    from filters import filter_function
+    image = Image.open(path)
+    image.load()
+    before = peak_mb()
+    start = time.perf_counter()
+    if engine == "numpy":
+        apply_operations(image, chain, FACTORS)
+    else:
+        for operation in chain:
+            image = filter_function(operation, FACTORS)(image)
+    elapsed = time.perf_counter() - start
+    return elapsed, peak_mb() - before if before is not None else None
+
+def main(sizes):
+    context = get_context("spawn")
+    print(f"{'size':>6} {'chain':>28} {'engine':>6} {'time (ms)':>10} {'MP/s':>7} {'extra peak (MB)':>16}")
+    with tempfile.TemporaryDirectory() as folder:
+        for megapixels in sizes:
+            width = int((megapixels * 1_000_000 * 4 / 3) ** 0.5)
+            height = int(width * 3 / 4)
+            path = os.path.join(folder, f"{megapixels}.ppm") # uncompressed, so loading needs no extra memory
+            bands = [Image.effect_noise((width, height), 64).convert("L") for _ in range(3)]
+            Image.merge("RGB", bands).save(path)
+            del bands
+            for chain in CHAINS:
+                for engine in ("pil", "numpy"):
+                    with context.Pool(1) as pool:
+                        elapsed, extra = pool.apply(measure, (path, engine, chain))
+                    extra = f"{extra:>16.1f}" if extra is not None else f"{'unavailable':>16}"
+                    print(f"{megapixels:>4}MP {'+'.join(chain):>28} {engine:>6} {elapsed * 1000:>10.1f} "
+                          f"{width * height / elapsed / 1e6:>7.1f} {extra}")
+
+if __name__ == "__main__":
+    main([float(size) for size in sys.argv[1:]] or SIZES)
@@ -0,0 +1,100 @@
+# import libraries
+from collections import OrderedDict
+from PyQt5.QtCore import QObject, QEvent, QTimer, Qt
+from PyQt5.QtWidgets import QSizePolicy
+from qt_image import pil_to_qpixmap
+from svg import render_pixmap
+from timing import stage
+
+# how long the window has to stay the same size before the smooth pass, and how many
+# pixmaps (full size and scaled) to remember
+SETTLE_MS = 150
+CACHE_SIZE = 12
+
+# Shows PIL images in a QLabel, scaled to fit. Scaled pixmaps are cached per (image, size),
+# and while the window is being resized a fast scale is used, followed by a smooth one
+# once resizing stops.
+class PictureView(QObject):
+    def __init__(self, label, settle_ms=SETTLE_MS, cache_size=CACHE_SIZE):
+        super().__init__()
+        self.label = label
+        self.label.setAlignment(Qt.AlignCenter)
+        self.label.setMinimumSize(1, 1)
+        self.label.setSizePolicy(QSizePolicy.Ignored, QSizePolicy.Ignored) # let the window shrink below the picture
+        self.label.installEventFilter(self)
+        self.image = None
+        self.svg = None # SVG file the image was drawn from, redrawn at window size while unedited
+        self.drawn = None # last drawing of that file
+        self.cache = OrderedDict() # (id of image, width, height, smooth) -> (image, pixmap), oldest first
+        self.cache_size = cache_size
+        self.settle_timer = QTimer()
+        self.settle_timer.setSingleShot(True)
+        self.settle_timer.setInterval(settle_ms)
+        self.settle_timer.timeout.connect(lambda: self.show(smooth=True))
+
+    # show a new image (images are never changed in place, so the same object means the same picture);
+    # with svg set, the file is drawn at the window size instead of scaling the image
+    def set_image(self, image, svg=None):
+        self.image = image
+        self.svg = svg
+        self.drawn = None
+        self.show(smooth=True)
+
+    # show a message instead of a picture
+    def clear(self, text):
+        self.image = None
+        self.svg = None
+        self.drawn = None
+        self.settle_timer.stop()
+        self.label.setText(text) # (drops the pixmap as well)
+
+    def cached(self, key, make):
+        entry = self.cache.get(key)
+        if entry is None:
+            entry = (self.image, make()) # keep the image so its id can't be reused while cached
+            self.cache[key] = entry
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        else:
+            self.cache.move_to_end(key)
+        return entry[1]
+
+    def show(self, smooth=True):
+        if self.image is None:
+            return
+        w, h = self.label.width(), self.label.height()
+        if self.svg is not None:
+            self.show_svg(w, h, smooth)
+            return
+        full = self.cached((id(self.image), None, None, None), self.make_pixmap)
+        mode = Qt.SmoothTransformation if smooth else Qt.FastTransformation
+        scaled = self.cached((id(self.image), w, h, smooth), lambda: self.scale(full, w, h, mode))
+        self.label.setPixmap(scaled)
+
+    # draw the SVG only once the size has settled; meanwhile stretch the last drawing quickly
+    def show_svg(self, w, h, smooth):
+        if smooth or self.drawn is None:
+            self.drawn = self.cached((id(self.image), w, h, True), lambda: render_pixmap(self.svg, w, h))
+            self.label.setPixmap(self.drawn)
+        else:
+            self.label.setPixmap(self.drawn.scaled(w, h, Qt.KeepAspectRatio, Qt.FastTransformation))
+
+    def make_pixmap(self):
+        with stage("pixmap", self.image.size):
+            return pil_to_qpixmap(self.image)
+
+    def scale(self, pixmap, w, h, mode):
+        name = "scale smooth" if mode == Qt.SmoothTransformation else "scale fast"
+        with stage(name, (pixmap.width(), pixmap.height())):
+            return pixmap.scaled(w, h, Qt.KeepAspectRatio, mode)
+
+    # on every resize step show a quick scale, and start the wait for the smooth one again
+    def eventFilter(self, watched, event):
+        if watched is self.label and event.type() == QEvent.Resize and self.image is not None:
+            smooth_key = (id(self.image), self.label.width(), self.label.height(), True)
+            if smooth_key in self.cache:
+                self.show(smooth=True)
+            else:
+                self.show(smooth=False)
+                self.settle_timer.start()
+        return False
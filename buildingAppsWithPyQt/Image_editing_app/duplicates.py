@@ -0,0 +1,165 @@
+# Near-duplicate finder: every image gets 64-bit perceptual hashes (aHash, dHash, pHash),
+# kept in an index on disk so a re-scan only hashes new or changed files, and similar
+# images are grouped by looking each hash up in a BK-tree instead of comparing every pair.
+import math
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+from filters import upright
+
+# where the hashes are kept between runs
+INDEX_FILE = os.path.join(os.path.expanduser("~"), ".cache", "photoqt", "hashes.sqlite")
+
+# images whose pHashes differ in at most this many of their 64 bits count as the same picture
+MAX_DISTANCE = 8
+
+HASH_NAMES = ("ahash", "dhash", "phash")
+
+def bits_to_int(bits):
+    value = 0
+    for bit in bits:
+        value = (value << 1) | bool(bit)
+    return value
+
+# average hash: which pixels of an 8x8 gray copy are brighter than the mean
+def ahash(gray):
+    pixels = list(gray.resize((8, 8), Image.BOX).getdata())
+    mean = sum(pixels) / len(pixels)
+    return bits_to_int(pixel > mean for pixel in pixels)
+
+# difference hash: whether each pixel of a 9x8 gray copy is brighter than its right neighbour
+def dhash(gray):
+    pixels = list(gray.resize((9, 8), Image.BOX).getdata())
+    return bits_to_int(pixels[row * 9 + col] > pixels[row * 9 + col + 1] for row in range(8) for col in range(8))
+
+# cosine table for the 8 lowest frequencies of a 32 point DCT
+dct_table = [[math.cos(math.pi * (2 * x + 1) * u / 64) for x in range(32)] for u in range(8)]
+
+# perceptual hash: which of the lowest 8x8 DCT frequencies of a 32x32 gray copy are above
+# their median (the first one, the overall brightness, is left out of the median)
+def phash(gray):
+    pixels = list(gray.resize((32, 32), Image.BOX).getdata())
+    rows = [pixels[y * 32:(y + 1) * 32] for y in range(32)]
+    row_dct = [[sum(c * p for c, p in zip(cosines, row)) for cosines in dct_table] for row in rows]
+    dct = [[sum(dct_table[v][y] * row_dct[y][u] for y in range(32)) for u in range(8)] for v in range(8)]
+    values = [value for line in dct for value in line]
+    median = sorted(values[1:])[len(values[1:]) // 2]
+    return bits_to_int(value > median for value in values)
+
+# all three hashes of a file, decoding JPEGs at a reduced scale as only 32x32 pixels are needed
+def image_hashes(fullname):
+    with Image.open(fullname) as image:
+        image.draft("L", (64, 64))
+        gray = upright(image).convert("L")
+    return {"ahash": ahash(gray), "dhash": dhash(gray), "phash": phash(gray)}
+
+def hamming(first, second):
+    return bin(first ^ second).count("1")
+
+# BK-tree over Hamming distance: each child sits under the distance it has to its parent,
+# so a search only follows children whose distance can still be within the radius
+class BKTree():
+    def __init__(self):
+        self.root = None # [hash, items, {distance: child node}]
+
+    def add(self, value, item):
+        if self.root is None:
+            self.root = [value, [item], {}]
+            return
+        node = self.root
+        while True:
+            distance = hamming(value, node[0])
+            if distance == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value, [item], {}]
+                return
+            node = child
+
+    # every item whose hash is at most radius bits away
+    def search(self, value, radius):
+        found = []
+        nodes = [self.root] if self.root is not None else []
+        while nodes:
+            node = nodes.pop()
+            distance = hamming(value, node[0])
+            if distance <= radius:
+                found.extend(node[1])
+            for child_distance, child in node[2].items():
+                if distance - radius <= child_distance <= distance + radius:
+                    nodes.append(child)
+        return found
+
+# groups (sorted lists, biggest first) of names whose hashes are within max_distance,
+# joined transitively; names without a near-duplicate are left out
+def find_groups(hashes, max_distance=MAX_DISTANCE):
+    tree = BKTree()
+    for name, value in hashes.items():
+        tree.add(value, name)
+    parent = {name: name for name in hashes}
+
+    def root(name):
+        while parent[name] != name:
+            parent[name] = parent[parent[name]]
+            name = parent[name]
+        return name
+
+    for name, value in hashes.items():
+        for other in tree.search(value, max_distance):
+            parent[root(other)] = root(name)
+    groups = {}
+    for name in hashes:
+        groups.setdefault(root(name), []).append(name)
+    return sorted((sorted(group) for group in groups.values() if len(group) > 1), key=lambda group: (-len(group), group))
+
+# Hashes of image files on disk, keyed by path, modification time and file size
+class HashIndex():
+    def __init__(self, fullname=INDEX_FILE):
+        os.makedirs(os.path.dirname(fullname), exist_ok=True)
+        self.connection = sqlite3.connect(fullname, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock, self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS hashes (path TEXT PRIMARY KEY, mtime INTEGER, "
+                                    "size INTEGER, ahash TEXT, dhash TEXT, phash TEXT)")
+
+    # stored hashes if the file hasn't changed since, else None
+    def lookup(self, fullname, stat):
+        with self.lock:
+            row = self.connection.execute("SELECT mtime, size, ahash, dhash, phash FROM hashes WHERE path = ?",
+                                          (fullname,)).fetchone()
+        if row is None or row[0] != stat.st_mtime_ns or row[1] != stat.st_size:
+            return None
+        return dict(zip(HASH_NAMES, (int(value, 16) for value in row[2:])))
+
+    # (64-bit hashes don't fit SQLite's signed integers, so they are stored as hex)
+    def store(self, fullname, stat, hashes):
+        with self.lock, self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?, ?)",
+                                    (fullname, stat.st_mtime_ns, stat.st_size,
+                                     *(f"{hashes[name]:016x}" for name in HASH_NAMES)))
+
+    # hashes of a file, from the index when it is up to date
+    def get(self, fullname):
+        stat = os.stat(fullname)
+        hashes = self.lookup(fullname, stat)
+        if hashes is None:
+            hashes = image_hashes(fullname)
+            self.store(fullname, stat, hashes)
+        return hashes
+
+# hash every file in a folder (in parallel, reusing the index) and group the near-duplicates;
+# files that can't be read are skipped
+def find_duplicates(folder, filenames, index, hash_name="phash", max_distance=MAX_DISTANCE, workers=None):
+    def hash_file(filename):
+        try:
+            return filename, index.get(os.path.join(folder, filename))[hash_name]
+        except (OSError, ValueError, SyntaxError, Image.DecompressionBombError):
+            return filename, None
+
+    with ThreadPoolExecutor(workers or os.cpu_count()) as pool: # decoding lets go of the GIL
+        hashes = {name: value for name, value in pool.map(hash_file, filenames) if value is not None}
+    return find_groups(hashes, max_distance)
@@ -0,0 +1,113 @@
+# import libraries
+import threading
+from collections import OrderedDict
+from filters import transformations
+from timing import stage
+
+# default memory budget for cached in-between images (bytes)
+CACHE_LIMIT = 256 * 1024 * 1024
+
+# rough number of bytes an image takes up in memory
+def image_bytes(image):
+    if image is None:
+        return 0
+    return image.width * image.height * len(image.getbands())
+
+# Ordered list of edits with undo/redo and a cache of in-between results
+class EditStack():
+    def __init__(self, cache_limit=CACHE_LIMIT):
+        self.base = None # image the edits start from
+        self.steps = [] # every edit, including ones that were undone
+        self.position = 0 # how many steps are currently applied
+        self.cache = OrderedDict() # (step, step, ...) -> image, least recently used first
+        self.cache_limit = cache_limit
+        self.cache_size = 0
+        self.lock = threading.Lock() # render() can be called from worker threads
+
+    # start again from a new image
+    def reset(self, base):
+        with self.lock:
+            self.base = base
+            self.steps = []
+            self.position = 0
+            self.cache.clear()
+            self.cache_size = 0
+
+    # the edits that are currently applied
+    @property
+    def operations(self):
+        return self.steps[:self.position]
+
+    # add an edit at the end, dropping anything that was undone
+    def push(self, operation):
+        del self.steps[self.position:]
+        self.steps.append(operation)
+        self.position += 1
+
+    # change an earlier edit, keeping the ones after it
+    def replace(self, index, operation):
+        self.steps[index] = operation
+
+    # remove an earlier edit, keeping the ones after it
+    def remove(self, index):
+        del self.steps[index]
+        if index < self.position:
+            self.position -= 1
+
+    # go back to the original image
+    def clear(self):
+        del self.steps[:]
+        self.position = 0
+
+    def can_undo(self):
+        return self.position > 0
+
+    def can_redo(self):
+        return self.position < len(self.steps)
+
+    def undo(self):
+        if self.can_undo():
+            self.position -= 1
+
+    def redo(self):
+        if self.can_redo():
+            self.position += 1
+
+    # get the image for the current edits (or the given ones), starting from the closest cached result
+    def render(self, operations=None):
+        key = tuple(self.operations if operations is None else operations)
+        with self.lock:
+            base = self.base
+            start = len(key)
+            while start > 0 and key[:start] not in self.cache:
+                start -= 1
+            if start > 0:
+                image = self.cache[key[:start]]
+                self.cache.move_to_end(key[:start])
+        if start == 0:
+            image = base
+        for index in range(start, len(key)):
+            transform_function = transformations.get(key[index])
+            if transform_function:
+                with stage("filter:" + key[index], image.size):
+                    image = transform_function(image)
+            with self.lock:
+                if self.base is not base: # a new image was loaded meanwhile
+                    return image
+                self.store(key[:index + 1], image)
+        return image
+
+    # keep an in-between image, forgetting the least recently used ones when over budget
+    # (call with the lock held)
+    def store(self, key, image):
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            return
+        size = image_bytes(image)
+        if size > self.cache_limit:
+            return
+        self.cache[key] = image
+        self.cache_size += size
+        while self.cache_size > self.cache_limit:
+            old_key, old_image = self.cache.popitem(last=False)
+            self.cache_size -= image_bytes(old_image)
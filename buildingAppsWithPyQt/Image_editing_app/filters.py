@@ -0,0 +1,259 @@
+# import libraries
+import os
+from PIL import Image, ImageEnhance, ImageFilter, ImageStat
+from timing import stage
+
+# file types the app lists and edits
+extensions = ['.jpg', '.jpeg', '.png', '.svg', '.gif', '.tif', '.tiff']
+image_extensions = set(extensions)
+
+# check a file name against the extensions, ignoring upper/lower case
+def is_image_file(filename):
+    return os.path.splitext(filename)[1].lower() in image_extensions
+
+# longest side (in pixels) of the preview copy used for interactive editing
+PROXY_MAX_SIZE = 1600
+
+# images bigger than this (in pixels) are never decoded at full size: the preview is made
+# tile by tile (or at reduced scale for JPEG) and saving goes through tiles.py
+LARGE_IMAGE_PIXELS = 50_000_000
+
+# how strongly the Color and Contrast buttons enhance the image
+ENHANCE_FACTOR = 1.2
+
+# All the filters the Editor can apply, shared by the buttons and the dropdown
+transformations = {
+    "B/W": lambda image: image.convert("L"),
+    "Color": lambda image: ImageEnhance.Color(image).enhance(ENHANCE_FACTOR),
+    "Contrast": lambda image: ImageEnhance.Contrast(image).enhance(ENHANCE_FACTOR),
+    "Blur": lambda image: image.filter(ImageFilter.BLUR),
+    "Left": lambda image: image.transpose(Image.ROTATE_90),
+    "Right": lambda image: image.transpose(Image.ROTATE_270),
+    "Mirror": lambda image: image.transpose(Image.FLIP_LEFT_RIGHT),
+    "Sharpen": lambda image: image.filter(ImageFilter.SHARPEN)
+}
+
+# a filter by name, with its own enhance factor if factors has one for "Color" or "Contrast"
+def filter_function(operation, factors=None):
+    factor = (factors or {}).get(operation)
+    if factor is None or operation not in ("Color", "Contrast"):
+        return transformations[operation]
+    enhancer = ImageEnhance.Color if operation == "Color" else ImageEnhance.Contrast
+    return lambda image: enhancer(image).enhance(factor)
+
+# Filters that only rotate or flip, and filters that change each pixel's colour on its own.
+# Every filter above is symmetric under rotating and flipping (Blur and Sharpen use
+# symmetric kernels, Contrast uses the image mean), so rotations and flips can be
+# moved to the end of a chain and merged into one transpose.
+geometric = {"Left", "Right", "Mirror"}
+tonal = {"B/W", "Color", "Contrast"}
+transpose_methods = [None, Image.FLIP_LEFT_RIGHT, Image.FLIP_TOP_BOTTOM, Image.ROTATE_90,
+                     Image.ROTATE_180, Image.ROTATE_270, Image.TRANSPOSE, Image.TRANSVERSE]
+gray_weights = [0.299, 0.587, 0.114] # what convert("L") uses
+
+# what has to be done to the stored pixels to show them the right way up, per EXIF orientation
+orientation_transposes = {
+    1: None,
+    2: Image.FLIP_LEFT_RIGHT,
+    3: Image.ROTATE_180,
+    4: Image.FLIP_TOP_BOTTOM,
+    5: Image.TRANSPOSE,
+    6: Image.ROTATE_270,
+    7: Image.TRANSVERSE,
+    8: Image.ROTATE_90,
+}
+
+# the transpose (or None) that turns an image the right way up, from its EXIF orientation
+def orientation_method(image):
+    return orientation_transposes.get(image.getexif().get(0x0112, 1))
+
+# turn an image the right way up (cameras often store pictures sideways and say so in EXIF)
+def upright(image):
+    method = orientation_method(image)
+    return image if method is None else image.transpose(method)
+
+# the single transpose (or None) that does the same as a list of rotations and flips,
+# optionally after a first transpose
+def fuse_geometry(operations, first=None):
+    probe = Image.frombytes("L", (3, 2), bytes(range(6))) # every pixel different, so each result is unique
+    result = probe if first is None else probe.transpose(first)
+    for operation in operations:
+        result = transformations[operation](result)
+    for method in transpose_methods:
+        candidate = probe if method is None else probe.transpose(method)
+        if candidate.size == result.size and candidate.tobytes() == result.tobytes():
+            return method
+
+# a 256 entry table pulling each value of table away from center, made by Image.blend itself
+# so it rounds exactly like the Contrast filter does
+def blend_table(center, table, factor=ENHANCE_FACTOR):
+    ramp = Image.frombytes("L", (256, 1), bytes(table))
+    return list(Image.blend(Image.new("L", ramp.size, center), ramp, factor).tobytes())
+
+# run a number of Contrast steps on an RGB or black and white image as one lookup table (the
+# same for every channel, as Contrast pulls each channel towards the mean gray level); clipping
+# still happens after every step. Each step's mean is worked out from the histogram, which is
+# exact for black and white; for RGB the gray level of each pixel after the first step isn't
+# known, so its mean comes from the channel means and can end up one level off
+def apply_contrast_table(image, steps, factor=ENHANCE_FACTOR):
+    bands = len(image.getbands())
+    histogram = image.histogram()
+    histograms = [histogram[256 * band:256 * (band + 1)] for band in range(bands)]
+    total = image.width * image.height
+    table = list(range(256))
+    for step in range(steps):
+        if bands == 3 and step == 0:
+            mean = int(ImageStat.Stat(image.convert("L")).mean[0] + 0.5) # what ImageEnhance does
+        else:
+            means = [sum(count * value for count, value in zip(counts, table)) / total for counts in histograms]
+            weights = gray_weights if bands == 3 else [1.0]
+            mean = int(sum(weight * value for weight, value in zip(weights, means)) + 0.5)
+        table = blend_table(mean, table, factor)
+    return image.point(table * bands)
+
+# run B/W, Color and Contrast steps with as few passes as possible: every run of Contrast
+# steps becomes one lookup table, and Color and B/W are skipped on black and white images
+# (where they change nothing). Color mixes each pixel with its own gray level, which no
+# table can do, so it still runs on its own and the result is clipped between steps.
+def apply_tonal(image, operations, factors=None):
+    if image.mode not in ("RGB", "L"):
+        for operation in operations:
+            image = filter_function(operation, factors)(image)
+        return image
+    contrasts = 0
+    for operation in list(operations) + [None]:
+        if operation == "Contrast":
+            contrasts += 1
+            continue
+        if contrasts:
+            image = apply_contrast_table(image, contrasts, (factors or {}).get("Contrast", ENHANCE_FACTOR))
+            contrasts = 0
+        if operation is not None and image.mode != "L":
+            image = filter_function(operation, factors)(image)
+    return image
+
+# turn a list of filter names into as few full-image passes as possible:
+# rotations and flips become one transpose at the end, and runs of two or more
+# tonal filters go through apply_tonal; returns a list of (description, function).
+# factors can set the enhance factor for "Color" and "Contrast"
+def compile_operations(operations, factors=None):
+    operations = [operation for operation in operations if operation in transformations]
+    steps = []
+    run = []
+    for operation in operations + [None]:
+        if operation in tonal:
+            run.append(operation)
+            continue
+        if len(run) == 1:
+            steps.append((run[0], filter_function(run[0], factors)))
+        elif run:
+            steps.append(("+".join(run), lambda image, run=tuple(run): apply_tonal(image, run, factors)))
+        run = []
+        if operation is not None and operation not in geometric:
+            steps.append((operation, transformations[operation]))
+    method = fuse_geometry([operation for operation in operations if operation in geometric])
+    if method is not None:
+        steps.append(("transpose", lambda image: image.transpose(method)))
+    return steps
+
+# run a list of filter names on an image, merging steps where possible
+def apply_operations(image, operations, factors=None):
+    for description, step in compile_operations(operations, factors):
+        with stage("filter:" + description, image.size):
+            image = step(image)
+    return image
+
+# the image in a mode every filter works on (palette GIF/PNG frames, 16-bit TIFF pages, ...)
+def editable(image):
+    if image.mode in ("RGB", "RGBA", "L"):
+        return image
+    if "A" in image.mode or "transparency" in image.info:
+        return image.convert("RGBA")
+    return image.convert("RGB")
+
+# make a small copy of the image that is quick to filter and show on screen
+def make_proxy(image, max_size=PROXY_MAX_SIZE):
+    proxy = image.copy()
+    proxy.thumbnail((max_size, max_size), Image.BILINEAR, reducing_gap=2.0)
+    return proxy
+
+# open an image file of any size, skipping PIL's check against decompression bombs (files
+# claiming far more pixels than they hold). That check is global and stays on for everything
+# else; only the paths that never decode a very large image in full open files this way.
+def open_large(fullname):
+    try:
+        return Image.open(fullname)
+    except Image.DecompressionBombError:
+        pass
+    with open(fullname, "rb") as file:
+        prefix = file.read(16)
+    Image.init()
+    for format_id in Image.ID:
+        factory, accept = Image.OPEN[format_id]
+        accepted = accept is None or accept(prefix)
+        if accepted and not isinstance(accepted, str): # (a string is a warning, not a match)
+            try:
+                return factory(fullname) # the same as Image.open does, less the size check
+            except (SyntaxError, IndexError, TypeError, ValueError):
+                continue
+    raise Image.UnidentifiedImageError(f"cannot identify image file {fullname!r}")
+
+# a copy of a very large image no bigger than max_size on either side, turned the right way
+# up, without decoding it in full: files that can be read in parts are shrunk a tile at a
+# time, JPEGs are decoded at reduced scale, and anything else is refused
+def large_preview(fullname, max_size=PROXY_MAX_SIZE):
+    from tiles import can_process_tiled, tiled_preview # (tiles.py imports this module)
+    if can_process_tiled(fullname):
+        return editable(tiled_preview(fullname, max_size))
+    with open_large(fullname) as image:
+        width, height = image.size
+        image.draft("RGB", (max_size, max_size)) # only does something for JPEG files
+        if image.width * image.height > LARGE_IMAGE_PIXELS:
+            raise ValueError(f"{width}x{height} is too large to open whole, and the file can't be read in parts")
+        image.thumbnail((max_size, max_size), Image.BILINEAR, reducing_gap=2.0)
+        return editable(upright(image))
+
+# open an image file and make its preview copy; for very large images the original
+# comes back as None and only the preview is made (see large_preview)
+def decode_image(fullname):
+    original = open_large(fullname)
+    if original.width * original.height > LARGE_IMAGE_PIXELS:
+        with stage("decode", original.size):
+            original.close()
+            return None, large_preview(fullname)
+    with stage("decode", original.size):
+        original.load()
+        original = editable(upright(original)) # the first frame, for animated and multi-page files
+    with stage("proxy", original.size):
+        return original, make_proxy(original)
+
+# file a save is written to first, so a crash never leaves half a file at the real name
+def temp_name(fullname):
+    root, ext = os.path.splitext(fullname)
+    return root + ".partial" + ext
+
+# save an image to a temporary file, then rename it over the real one in one step
+def save_atomic(image, fullname, **params):
+    temp = temp_name(fullname)
+    try:
+        with stage("encode", image.size):
+            image.save(temp, **params)
+        os.replace(temp, fullname)
+    except Exception:
+        if os.path.exists(temp):
+            os.remove(temp)
+        raise
+    return fullname
+
+# run the filters on the full resolution image and write it to disk
+def export_image(original, operations, fullname):
+    image = apply_operations(original, operations)
+    return save_atomic(image, fullname)
+
+# decode a file in full, run the filters and write it to disk; for very large files that
+# are one compressed stream (JPEG, PNG, ...) and so can't go through tiles.py
+def export_file(source, operations, fullname):
+    with open_large(source) as image:
+        image.load()
+        original = editable(upright(image))
+    return export_image(original, operations, fullname)
@@ -0,0 +1,91 @@
+# Animated GIF/PNG and multi-page TIFF files: the filters run on every frame, spread over
+# a thread pool (PIL lets go of the GIL while filtering), and the frames keep their durations and the file its loop count.
+# Frames are read one at a time and only a few are in flight, so the whole sequence is
+# never decoded at once. (The GIF and PNG writers in PIL still gather the finished frames
+# before writing; GIF frames are turned into palette images first to keep those small.
+# TIFF pages are written as they arrive.)
+import concurrent.futures
+import os
+from collections import deque
+from PIL import Image, ImageSequence
+from filters import apply_operations, editable, temp_name, open_large
+
+# frames being filtered at once per worker thread
+FRAMES_PER_WORKER = 2
+
+# formats whose extra frames are kept (camera JPEGs can hold a second, MPO, picture: not those)
+multiframe_formats = {"GIF", "PNG", "TIFF"}
+
+# more than one frame or page (only looks for a second frame, so it's quick for long GIFs;
+# reads no pixels, so any size of file is fine)
+def is_multiframe(fullname):
+    with open_large(fullname) as image:
+        return image.format in multiframe_formats and getattr(image, "is_animated", False)
+
+# runs on a worker thread: filter one frame, ready for the file format it is going into
+def filter_frame(frame, operations, image_format, duration, factors=None):
+    frame = apply_operations(frame, operations, factors)
+    if image_format == "GIF" and frame.mode == "RGB":
+        frame = frame.convert("P", palette=Image.ADAPTIVE) # what the GIF writer would do, done in parallel
+    if duration is not None:
+        frame.info["duration"] = duration # the GIF and PNG writers take each frame's own duration
+    return frame
+
+# yield the filtered frames in order, keeping at most `window` of them in flight
+def filtered_frames(image, operations, executor, window, factors=None):
+    in_flight = deque()
+    for frame in ImageSequence.Iterator(image):
+        duration = frame.info.get("duration")
+        in_flight.append(executor.submit(filter_frame, editable(frame).copy(), operations, image.format, duration,
+                                         factors))
+        if len(in_flight) >= window:
+            yield in_flight.popleft().result()
+    while in_flight:
+        yield in_flight.popleft().result()
+
+# Runs on the calling thread, for when that is already one of many workers (e.g. in batch.py,
+# whose worker processes each take a whole file)
+class InlineExecutor():
+    def submit(self, function, *args):
+        future = concurrent.futures.Future()
+        future.set_result(function(*args))
+        return future
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+# where the frames are filtered: worker threads, or the calling thread for workers=1. Threads
+# rather than processes, as the Editor calls this from a save thread of a process already
+# full of threads and open database connections, which forked children must not inherit
+def frame_executor(workers):
+    if workers <= 1:
+        return InlineExecutor()
+    return concurrent.futures.ThreadPoolExecutor(workers)
+
+# filter every frame of source and write them all to target, which must be the same format;
+# factors can set the enhance factor for "Color" and "Contrast"
+def process_frames(source, target, operations, workers=None, factors=None):
+    workers = workers or os.cpu_count()
+    with Image.open(source) as image, frame_executor(workers) as executor:
+        image_format = image.format
+        params = {"save_all": True, "format": image_format}
+        if "loop" in image.info:
+            params["loop"] = image.info["loop"]
+        if image_format == "TIFF" and "compression" in image.info:
+            params["compression"] = image.info["compression"]
+        frames = filtered_frames(image, list(operations), executor, workers * FRAMES_PER_WORKER, factors)
+        first = next(frames)
+        if image_format == "PNG":
+            frames = list(frames) # the APNG writer goes through the frames twice
+        temp = temp_name(target)
+        try:
+            first.save(temp, append_images=frames, **params)
+            os.replace(temp, target)
+        except Exception:
+            if os.path.exists(temp):
+                os.remove(temp)
+            raise
+    return target
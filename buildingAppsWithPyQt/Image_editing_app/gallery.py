@@ -0,0 +1,56 @@
+# import libraries
+from PyQt5.QtCore import QObject, QSize, QThreadPool, pyqtSignal
+from PyQt5.QtGui import QIcon, QPixmap
+from PyQt5.QtWidgets import QListWidget, QListWidgetItem, QListView
+from PIL import Image
+from filters import transformations
+from qt_image import pil_to_qimage
+from workers import TaskRunner
+
+# size of the gallery thumbnails
+GALLERY_SIZE = 120
+
+# runs on a worker thread: one filter on the small copy, ready for the GUI thread
+def render_preview(image, filter_name):
+    return pil_to_qimage(transformations[filter_name](image))
+
+# A strip of thumbnails showing every filter applied to the current image, rendered at the
+# same time on a worker pool; clicking one emits chosen(filter name)
+class FilterGallery(QObject):
+    chosen = pyqtSignal(str)
+
+    def __init__(self, size=GALLERY_SIZE):
+        super().__init__()
+        self.size = size
+        self.widget = QListWidget()
+        self.widget.setViewMode(QListView.IconMode)
+        self.widget.setFlow(QListView.LeftToRight)
+        self.widget.setWrapping(False)
+        self.widget.setMovement(QListView.Static)
+        self.widget.setIconSize(QSize(size, size))
+        self.widget.setFixedHeight(size + 50)
+        self.items = {}
+        for filter_name in transformations:
+            item = QListWidgetItem(filter_name)
+            self.widget.addItem(item)
+            self.items[filter_name] = item
+        self.widget.itemClicked.connect(lambda item: self.chosen.emit(item.text()))
+        self.tasks = TaskRunner(QThreadPool()) # own pool so the gallery doesn't hold up editing
+
+    # render every filter for a new image from one small copy of it
+    def update(self, image):
+        small = image.copy()
+        small.thumbnail((self.size, self.size), Image.BILINEAR)
+        for filter_name in self.items:
+            self.tasks.submit("gallery:" + filter_name, render_preview,
+                              lambda preview, filter_name=filter_name: self.set_preview(filter_name, preview),
+                              small, filter_name)
+
+    # no image: blank every thumbnail, and drop renders still on their way
+    def clear(self):
+        self.tasks.cancel_all()
+        for item in self.items.values():
+            item.setIcon(QIcon())
+
+    def set_preview(self, filter_name, preview):
+        self.items[filter_name].setIcon(QIcon(QPixmap.fromImage(preview)))
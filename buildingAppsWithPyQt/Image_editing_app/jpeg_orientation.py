@@ -0,0 +1,103 @@
+# Lossless Left/Right/Mirror for JPEG files: instead of decoding, transposing and
+# re-encoding the picture, only the EXIF orientation tag is changed, so the compressed
+# data is copied as it is and nothing is lost however often the picture is turned.
+import os
+import struct
+from PIL import Image
+from filters import geometric, orientation_transposes, fuse_geometry, temp_name
+
+ORIENTATION = 0x0112
+
+def is_jpeg(fullname):
+    with open(fullname, "rb") as file:
+        return file.read(2) == b"\xff\xd8"
+
+# the orientation that shows the picture as it looks after the given operations
+def combine_orientation(orientation, operations):
+    method = fuse_geometry(operations, first=orientation_transposes.get(orientation))
+    for candidate, candidate_method in orientation_transposes.items():
+        if candidate_method == method:
+            return candidate
+
+# (start, end) of each marker segment before the image data, with its marker byte
+def jpeg_segments(data):
+    position = 2
+    while position + 4 <= len(data) and data[position] == 0xFF:
+        marker = data[position + 1]
+        if marker in (0xD9, 0xDA): # end of image / start of the compressed data
+            break
+        length = struct.unpack(">H", data[position + 2:position + 4])[0]
+        yield marker, position, position + 2 + length
+        position += 2 + length
+
+# where the orientation value sits in the file, and its byte order; None if there isn't one
+def find_orientation(data, start, end):
+    tiff = start + 10 # skip marker, length and "Exif\0\0"
+    endian = "<" if data[tiff:tiff + 2] == b"II" else ">"
+    ifd = tiff + struct.unpack(endian + "I", data[tiff + 4:tiff + 8])[0]
+    count = struct.unpack(endian + "H", data[ifd:ifd + 2])[0]
+    for index in range(count):
+        entry = ifd + 2 + 12 * index
+        if entry + 12 > end:
+            break
+        if struct.unpack(endian + "H", data[entry:entry + 2])[0] == ORIENTATION:
+            return entry + 8, endian
+    return None
+
+def app1_segment(exif_bytes):
+    return b"\xff\xe1" + struct.pack(">H", len(exif_bytes) + 2) + exif_bytes
+
+# the JPEG file bytes with a new orientation, leaving the compressed picture untouched
+def set_orientation(data, orientation):
+    exif_segment = None
+    insert_at = 2
+    for marker, start, end in jpeg_segments(data):
+        if marker == 0xE0 and insert_at == start: # EXIF goes after a leading JFIF header
+            insert_at = end
+        if marker == 0xE1 and data[start + 4:start + 10] == b"Exif\x00\x00":
+            exif_segment = (start, end)
+            break
+
+    if exif_segment is None: # no EXIF at all: add a tiny block holding only the orientation
+        entry = struct.pack(">HHIHH", ORIENTATION, 3, 1, orientation, 0)
+        exif = b"Exif\x00\x00" + b"MM\x00*" + struct.pack(">I", 8) + struct.pack(">H", 1) + entry + struct.pack(">I", 0)
+        return data[:insert_at] + app1_segment(exif) + data[insert_at:]
+
+    start, end = exif_segment
+    found = find_orientation(data, start, end)
+    if found is not None: # usual case for camera files: change the two bytes in place
+        position, endian = found
+        return data[:position] + struct.pack(endian + "H", orientation) + data[position + 2:]
+
+    # EXIF without an orientation tag: let PIL write the block again with the tag added
+    exif = Image.Exif()
+    exif.load(data[start + 4:end])
+    exif[ORIENTATION] = orientation
+    return data[:start] + app1_segment(exif.tobytes()) + data[end:]
+
+# the current EXIF orientation of a JPEG file (1 if it has none)
+def read_orientation(data):
+    for marker, start, end in jpeg_segments(data):
+        if marker == 0xE1 and data[start + 4:start + 10] == b"Exif\x00\x00":
+            found = find_orientation(data, start, end)
+            if found is not None:
+                position, endian = found
+                value = struct.unpack(endian + "H", data[position:position + 2])[0]
+                return value if value in orientation_transposes else 1
+    return 1
+
+# only rotations and flips, so the lossless path can be used
+def is_geometric(operations):
+    return all(operation in geometric for operation in operations)
+
+# apply Left/Right/Mirror to a JPEG file by rewriting its orientation tag
+def rotate_jpeg(source, target, operations):
+    with open(source, "rb") as file:
+        data = file.read()
+    orientation = combine_orientation(read_orientation(data), operations)
+    data = set_orientation(data, orientation)
+    temp = temp_name(target)
+    with open(temp, "wb") as file:
+        file.write(data)
+    os.replace(temp, target)
+    return target
@@ -1,9 +1,25 @@
 # import libraries
 import os
-from PyQt5.QtWidgets import QApplication, QWidget, QFileDialog, QLabel, QPushButton, QListWidget, QComboBox, QVBoxLayout, QHBoxLayout
-from PyQt5.QtCore import Qt
-from PyQt5.QtGui import QPixmap
-from PIL import Image, ImageEnhance, ImageFilter
+from PyQt5.QtWidgets import QApplication, QWidget, QFileDialog, QLabel, QPushButton, QListWidget, QListWidgetItem, QListView, QComboBox, QCheckBox, QVBoxLayout, QHBoxLayout
+from PyQt5.QtCore import QSize, QThreadPool, QTimer, QFileSystemWatcher
+from PyQt5.QtGui import QIcon, QPixmap, QColor, QBrush
+from filters import export_image, export_file
+from tiles import process_tiled, can_process_tiled, output_extension
+from saver import SaveQueue
+from jpeg_orientation import is_jpeg, is_geometric, rotate_jpeg
+from edit_stack import EditStack
+from workers import TaskRunner
+from qt_image import pil_to_qimage
+from display import PictureView
+from gallery import FilterGallery
+from thumbnails import ThumbnailCache, THUMBNAIL_SIZE
+from scanner import DirectoryScanner
+from prefetch import DecodedImageCache, PREFETCH_COUNT
+from svg import is_svg, decode_file, make_file_thumbnail, export_svg
+from frames import is_multiframe, process_frames
+from duplicates import HashIndex, find_duplicates
+from validate import ValidationCache, validate_folder, quarantine, MISLABELED, CORRUPT
+import timing
 
 # App Settings
 app = QApplication([])
@@ -14,6 +30,10 @@ main_widow.resize(900,700)
 # App Widgets/Objects
 btn_folder = QPushButton("Folder")
 file_list = QListWidget()
+thumbnail_mode = QCheckBox("Thumbnails")
+duplicate_mode = QCheckBox("Duplicates")
+btn_quarantine = QPushButton("Move bad files aside")
+btn_quarantine.setEnabled(False)
 
 btn_left = QPushButton("Left")
 btn_right = QPushButton("Right")
@@ -23,6 +43,11 @@ gray = QPushButton("B/W")
 saturation = QPushButton("Color")
 contrast = QPushButton("Contrast")
 blur = QPushButton("Blur")
+btn_undo = QPushButton("Undo")
+btn_redo = QPushButton("Redo")
+btn_save = QPushButton("Save")
+autosave = QCheckBox("Auto-save")
+show_timings = QCheckBox("Timings")
 
 
 # DropDown Box
@@ -38,6 +63,9 @@ filter_box.addItem("Contrast")
 filter_box.addItem("Blur")
 
 picture_box = QLabel("Image will appear here")
+gallery = FilterGallery() # every filter applied to the current image, click one to use it
+timing_readout = QLabel()
+timing_readout.hide()
 
 
 # App Design
@@ -47,7 +75,10 @@ col1 = QVBoxLayout()
 col2 = QVBoxLayout()
 
 col1.addWidget(btn_folder)
+col1.addWidget(thumbnail_mode)
+col1.addWidget(duplicate_mode)
 col1.addWidget(file_list)
+col1.addWidget(btn_quarantine)
 col1.addWidget(filter_box)
 col1.addWidget(btn_left)
 col1.addWidget(btn_right)
@@ -57,8 +88,15 @@ col1.addWidget(gray)
 col1.addWidget(saturation)
 col1.addWidget(contrast)
 col1.addWidget(blur)
+col1.addWidget(btn_undo)
+col1.addWidget(btn_redo)
+col1.addWidget(btn_save)
+col1.addWidget(autosave)
+col1.addWidget(show_timings)
 
 col2.addWidget(picture_box)
+col2.addWidget(gallery.widget)
+col2.addWidget(timing_readout)
 
 # link the layout to the column
 master_layout.addLayout(col1, 20)
@@ -71,59 +109,292 @@ main_widow.setLayout(master_layout)
 
 working_directory = ""
 
-# Filter Files and Extensions
-
-def filter(files, extensions):
-    results = []
-    for file in files:
-        for ext in extensions:
-            if file.endswith(ext):
-                results.append(file)
-    return results
-
 # Choose current work Directory
 
 def getWorkingDirectory():
     global working_directory
-    working_directory = QFileDialog.getExistingDirectory()
-    extensions = ['.jpg', '.jpeg', '.png', '.svg']
-    filenames = filter(os.listdir(working_directory), extensions)
+    folder = QFileDialog.getExistingDirectory()
+    if not folder:
+        return
+    working_directory = folder
     file_list.clear()
+    file_items.clear()
+    thumbnail_tasks.cancel_all()
+    thumbnail_items.clear()
+    if folder_watcher.directories():
+        folder_watcher.removePaths(folder_watcher.directories())
+    folder_watcher.addPath(working_directory)
+    scanFolder()
+
+# Folder scanning in the background, kept up to date when files are added or removed
+file_items = {} # file name -> list item
+scanners = [] # scans still running, kept alive until they finish
+folder_watcher = QFileSystemWatcher()
+rescan_timer = QTimer() # waits for a burst of folder changes to settle before rescanning
+rescan_timer.setSingleShot(True)
+rescan_timer.setInterval(500)
+
+def scanFolder():
+    for old in scanners:
+        old.requestInterruption()
+    scanner = DirectoryScanner(working_directory)
+    scanner.found.connect(addFiles)
+    scanner.scanned.connect(removeMissingFiles)
+    scanner.finished.connect(lambda: scanners.remove(scanner))
+    scanners.append(scanner)
+    scanner.start()
+
+# add a batch of newly found files to the list
+def addFiles(folder, filenames):
+    if folder != working_directory:
+        return
+    new_items = []
+    file_list.setUpdatesEnabled(False)
     for filename in filenames:
-        file_list.addItem(filename)
+        if filename not in file_items:
+            item = QListWidgetItem(filename)
+            file_list.addItem(item)
+            file_items[filename] = item
+            new_items.append(item)
+    file_list.setUpdatesEnabled(True)
+    if thumbnail_mode.isChecked():
+        load_thumbnails(new_items)
+
+# once a scan is complete, drop files that are no longer in the folder
+def removeMissingFiles(folder, filenames):
+    if folder != working_directory:
+        return
+    for filename in set(file_items) - filenames:
+        item = file_items.pop(filename)
+        thumbnail_items.pop(os.path.join(working_directory, filename), None)
+        file_list.takeItem(file_list.row(item))
+        file_problems.pop(filename, None)
+    validateFiles() # only new or changed files get checked again
+    if duplicate_mode.isChecked():
+        findDuplicates() # only new or changed files get hashed again
+
+# Thumbnails for the file list, made in the background and kept on disk between runs
+thumbnail_cache = ThumbnailCache(make=make_file_thumbnail) # SVGs are drawn at thumbnail size
+thumbnail_tasks = TaskRunner(QThreadPool()) # own pool so thumbnails don't hold up editing
+thumbnail_items = {} # full path -> list item still waiting for its icon
+
+def load_thumbnails(items=None):
+    if items is None:
+        thumbnail_tasks.cancel_all()
+        thumbnail_items.clear()
+        items = [file_list.item(row) for row in range(file_list.count())]
+    for item in items:
+        fullname = os.path.join(working_directory, item.text())
+        thumbnail_items[fullname] = item
+        thumbnail_tasks.submit("thumbnail:" + fullname, make_thumbnail_image,
+                               lambda image, fullname=fullname: set_thumbnail(fullname, image), fullname)
+
+# runs on the worker thread: QImage is safe to build there, QPixmap is not
+def make_thumbnail_image(fullname):
+    return pil_to_qimage(thumbnail_cache.get(fullname))
+
+def set_thumbnail(fullname, image):
+    item = thumbnail_items.pop(fullname, None)
+    if item is not None:
+        item.setIcon(QIcon(QPixmap.fromImage(image)))
+
+# switch the file list between names only and an icon grid
+def toggleThumbnails(checked):
+    if checked:
+        file_list.setViewMode(QListView.IconMode)
+        file_list.setIconSize(QSize(THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+        file_list.setResizeMode(QListView.Adjust)
+        file_list.setUniformItemSizes(True)
+        load_thumbnails()
+    else:
+        thumbnail_tasks.cancel_all()
+        thumbnail_items.clear()
+        file_list.setViewMode(QListView.ListMode)
+        for row in range(file_list.count()):
+            file_list.item(row).setIcon(QIcon())
+
+# Validation: after every scan each file's first bytes are checked and PIL verifies it, in the
+# background and only for new or changed files, so clicking a broken file never tries to decode it
+validation_cache = ValidationCache()
+validation_tasks = TaskRunner(QThreadPool()) # own pool so checking doesn't hold up editing
+file_problems = {} # file name -> (status, reason) for files that aren't fine
+problem_colors = {MISLABELED: QColor("darkorange"), CORRUPT: QColor("red")}
+
+def validateFiles():
+    validation_tasks.submit("validate", validate_folder,
+                            lambda problems, folder=working_directory: showProblems(folder, problems),
+                            working_directory, list(file_items), validation_cache)
+
+# flag bad files in red (can't be opened) or orange (wrong extension), and unflag fixed ones
+def showProblems(folder, problems):
+    if folder != working_directory:
+        return
+    for filename in set(file_problems) | set(problems):
+        item = file_items.get(filename)
+        if item is None:
+            continue
+        if filename in problems:
+            status, reason = problems[filename]
+            item.setForeground(problem_colors[status])
+            item.setToolTip(f"{status}: {reason}")
+        else:
+            item.setForeground(QBrush())
+            item.setToolTip("")
+    file_problems.clear()
+    file_problems.update(problems)
+    btn_quarantine.setEnabled(any(status == CORRUPT for status, reason in problems.values()))
+
+# move the files that can't be opened into the quarantine folder (logged there);
+# the folder watcher then takes them off the list
+def quarantineFiles():
+    corrupt = {filename: result for filename, result in file_problems.items() if result[0] == CORRUPT}
+    for filename in quarantine(working_directory, corrupt):
+        del file_problems[filename]
+    btn_quarantine.setEnabled(False)
+
+# Near-duplicates: files are hashed in the background (the hashes are kept on disk), then
+# the file list shows only the files that have a look-alike, group by group
+hash_index = HashIndex()
+duplicate_tasks = TaskRunner(QThreadPool()) # own pool so hashing doesn't hold up editing
+group_colors = [QColor("#fde9c9"), QColor("#d6ecfa")] # alternate so neighbouring groups stand apart
+
+def findDuplicates():
+    duplicate_tasks.submit("duplicates", find_duplicates,
+                           lambda groups, folder=working_directory: showDuplicates(folder, groups),
+                           working_directory, list(file_items), hash_index)
+
+def showDuplicates(folder, groups):
+    if folder != working_directory or not duplicate_mode.isChecked():
+        return
+    current = file_list.currentItem()
+    file_list.blockSignals(True) # moving items around isn't the user picking another file
+    grouped = set()
+    for number, group in enumerate(groups):
+        for filename in group:
+            item = file_items.get(filename)
+            if item is None:
+                continue
+            file_list.insertItem(len(grouped), file_list.takeItem(file_list.row(item)))
+            item.setBackground(group_colors[number % len(group_colors)])
+            item.setToolTip(f"Group {number + 1}: " + ", ".join(group))
+            grouped.add(filename)
+    for filename, item in file_items.items():
+        item.setHidden(filename not in grouped)
+    if current is not None:
+        file_list.setCurrentItem(current)
+    file_list.blockSignals(False)
+
+# show every file again, in name order
+def toggleDuplicates(checked):
+    if checked:
+        findDuplicates()
+        return
+    duplicate_tasks.cancel_all()
+    for item in file_items.values():
+        item.setHidden(False)
+        item.setBackground(QBrush())
+        item.setToolTip("")
+    file_list.blockSignals(True)
+    file_list.sortItems()
+    file_list.blockSignals(False)
 
 # Class for Editing, Loading, and Saving Image
 # Image Editing Class
 class Editor():
     def __init__(self):
-        self.image = None
-        self.original = None
+        self.image = None # small preview copy that the filters run on
+        self.original = None # full resolution image, only used when saving (None for very large images)
+        self.proxy = None # small copy of the original
+        self.source = None # path of the file being edited
+        self.edits = EditStack() # filters applied so far, replayed on the original when saving
         self.filename = None
         self.save_folder = "edits/"
+        self.tasks = TaskRunner(QThreadPool()) # decoding and filtering run in the background, on their own pool
+        self.saves = SaveQueue() # so do saves, merged per file and written atomically
+        self.view = PictureView(picture_box) # keeps the picture fitted to the window as it resizes
+        self.decoded = DecodedImageCache(decode=decode_file) # recently shown and prefetched images
      
-    # load image class 
+    # load image class  # uses an already decoded copy if there is one, otherwise
+    # decodes in the background, a newer click replaces an older one
     def load_image(self, filename):
+        fullname = os.path.join(working_directory, filename)
+        self.tasks.cancel("render")
+        result = self.decoded.lookup(fullname)
+        if result is not None:
+            self.tasks.cancel("load")
+            self.image_loaded(filename, result)
+            return
+        self.tasks.submit("load", self.decoded.get, lambda result: self.image_loaded(filename, result), fullname,
+                          on_error=lambda message: self.unload(f"Could not open {filename}: {message}"))
+        
+    def image_loaded(self, filename, result):
         self.filename = filename
-        fullname = os.path.join(working_directory, self.filename)
-        self.image = Image.open(fullname)
-        self.original = self.image.copy()
+        self.source = os.path.join(working_directory, filename)
+        self.original, self.proxy = result
+        self.edits.reset(self.proxy)
+        self.image = self.proxy
+        self.show_image()
+
+    # forget the current image and show a message instead (the file clicked can't be opened),
+    # so nothing of the last image is left to edit or save
+    def unload(self, message):
+        self.tasks.cancel_all()
+        self.image = self.original = self.proxy = None
+        self.source = self.filename = None
+        self.edits.reset(None)
+        self.view.clear(message)
+        gallery.clear()
         
-    # save image class
+    # save image class  # runs all the filters on the full resolution image in the background;
+    # very large images that can be read in parts are streamed through the filters tile by
+    # tile into a PPM/PGM file, other very large images have to be decoded in full
     def save_image(self):
+        if self.proxy is None:
+            return
         path = os.path.join(working_directory, self.save_folder)
         if not(os.path.exists(path) or os.path.isdir(path)):
             os.mkdir(path)  
         fullname = os.path.join(path, self.filename)
-        self.image.save(fullname)
+        operations = tuple(self.edits.operations)
+        if is_svg(self.source):
+            # drawn again at export size so the filters aren't stuck at preview resolution
+            fullname = os.path.splitext(fullname)[0] + ".png"
+            self.saves.submit(fullname, export_svg, self.source, operations, fullname)
+            return
+        if is_multiframe(self.source):
+            # the preview is the first frame; every frame is filtered on a thread pool
+            self.saves.submit(fullname, process_frames, self.source, fullname, operations)
+            return
+        if is_geometric(operations) and is_jpeg(self.source):
+            # only turned or flipped: rewrite the EXIF orientation instead of re-encoding the JPEG
+            self.saves.submit(fullname, rotate_jpeg, self.source, fullname, operations)
+            return
+        if self.original is None and can_process_tiled(self.source):
+            fullname = os.path.splitext(fullname)[0] + output_extension(self.source, operations)
+            self.saves.submit(fullname, process_tiled, self.source, fullname, operations)
+            return
+        if self.original is None:
+            self.saves.submit(fullname, export_file, self.source, operations, fullname)
+            return
+        self.saves.submit(fullname, export_image, self.original, operations, fullname)
+        
+    # filter the preview in the background, dropping results that are already out of date
+    def render(self):
+        if self.proxy is None:
+            return
+        self.tasks.submit("render", self.edits.render, self.image_rendered, tuple(self.edits.operations))
+        if autosave.isChecked():
+            self.save_image()
         
-    # show image class  # QPixmap allows us to load images in python
-    def show_image(self, path):
-        picture_box.hide()
-        image = QPixmap(path)
-        w,h = picture_box.width(), picture_box.height()
-        image = image.scaled(w,h, Qt.KeepAspectRatio)
-        picture_box.setPixmap(image)
-        picture_box.show()
+    def image_rendered(self, image):
+        self.image = image
+        self.show_image()
+        
+    # show image class  # the PIL image in memory goes straight to the screen, scaled to fit
+    def show_image(self):
+        unedited_svg = is_svg(self.source) and not self.edits.operations
+        self.view.set_image(self.image, svg=self.source if unedited_svg else None)
+        gallery.update(self.image)
         
     # editing tools function
     # def gray(self):
@@ -169,59 +440,35 @@ class Editor():
     #     self.show_image(image_path)
         
     # def contrast(self):
-        self.image = ImageEnhance.Contrast(self.image).enhance(1.2)
-        self.save_image()
-        image_path = os.path.join(working_directory, self.save_folder, self.filename)
-        self.show_image(image_path)
+    #     self.image = ImageEnhance.Contrast(self.image).enhance(1.2)
+    #     self.save_image()
+    #     image_path = os.path.join(working_directory, self.save_folder, self.filename)
+    #     self.show_image(image_path)
     
     def transformImage(self, transformation):
-        transformations = {
-            "B/W": lambda image:image.convert("L"),
-            "Color": lambda image:ImageEnhance.Color(image).enhance(1.2),
-            "Contrast": lambda image:ImageEnhance.Contrast(image).enhance(1.2),
-            "Blur": lambda image: image.filter(ImageFilter.BLUR),
-            "Left": lambda image: image.transpose(Image.ROTATE_90),
-            "Right": lambda image: image.transpose(Image.ROTATE_270),
-            "Mirror": lambda image: image.transpose(Image.FLIP_LEFT_RIGHT),
-            "Sharpen": lambda image: image.filter(ImageFilter.SHARPEN)
-        }
-        
-        transform_function = transformations.get(transformation)
-        if transform_function:
-            self.image = transform_function(self.image)
-            self.save_image()
-            
-        self.save_image()
-        image_path = os.path.join(working_directory, self.save_folder, self.filename)
-        self.show_image(image_path)
+        if self.proxy is None:
+            return
+        self.edits.push(transformation)
+        self.render()
     
     # Filter Dropdown Function   
     def apply_filter(self, filter_name):
+        if self.proxy is None:
+            return
         if filter_name == "Original":
-            self.image = self.original.copy()
+            self.edits.clear()
         else:
-            mapping = { # create a lists for filter dropdown
-                "B/W": lambda image:image.convert("L"),
-                "Color": lambda image:ImageEnhance.Color(image).enhance(1.2),
-                "Contrast": lambda image:ImageEnhance.Contrast(image).enhance(1.2),
-                "Blur": lambda image: image.filter(ImageFilter.BLUR),
-                "Left": lambda image: image.transpose(Image.ROTATE_90),
-                "Right": lambda image: image.transpose(Image.ROTATE_270),
-                "Mirror": lambda image: image.transpose(Image.FLIP_LEFT_RIGHT),
-                "Sharpen": lambda image: image.filter(ImageFilter.SHARPEN)
-            }
-            
-            filter_function = mapping.get(filter_name)
-            if filter_function:
-                self.image = filter_function(self.image)
-                self.save_image()
-                image_path = os.path.join(working_directory, self.save_folder, self.filename)
-                self.show_image(image_path)
-            pass
+            self.edits.push(filter_name)
+        self.render()
+        
+    # Undo and Redo, reusing cached results where possible
+    def undo(self):
+        self.edits.undo()
+        self.render()
         
-        self.save_image()
-        image_path = os.path.join(working_directory, self.save_folder, self.filename)
-        self.show_image(image_path)
+    def redo(self):
+        self.edits.redo()
+        self.render()
         
 # function to handle filter
 def handle_filter():
@@ -229,20 +476,81 @@ def handle_filter():
         select_filter = filter_box.currentText()
         main.apply_filter(select_filter) 
 
+# function to save the full resolution image into the edits folder
+def handle_save():
+    if file_list.currentRow() >= 0:
+        main.save_image()
+
+# functions to undo and redo the last edit
+def handle_undo():
+    if file_list.currentRow() >= 0:
+        main.undo()
+
+def handle_redo():
+    if file_list.currentRow() >= 0:
+        main.redo()
         
 # function to display image that was clicked
 def displayImage():
     if file_list.currentRow() >= 0:
         filename = file_list.currentItem().text()
+        status, reason = file_problems.get(filename, (None, None))
+        if status == CORRUPT:
+            main.unload(f"Can't open {filename}: {reason}")
+            return
         main.load_image(filename)
-        main.show_image(os.path.join(working_directory, main.filename))
+        prefetchNeighbours(file_list.currentRow())
+
+# decode the files either side of the current one in the background, ready for the arrow keys
+prefetch_tasks = TaskRunner(QThreadPool()) # own pool so prefetching doesn't hold up editing
+prefetch_tasks.pool.setMaxThreadCount(2)
+
+def prefetchNeighbours(row):
+    prefetch_tasks.cancel_all() # forget queued files from the last position
+    for offset in range(1, PREFETCH_COUNT + 1):
+        for neighbour in (row + offset, row - offset):
+            if 0 <= neighbour < file_list.count():
+                filename = file_list.item(neighbour).text()
+                if filename in file_problems and file_problems[filename][0] == CORRUPT:
+                    continue # known not to open
+                fullname = os.path.join(working_directory, filename)
+                if fullname not in main.decoded:
+                    prefetch_tasks.submit("prefetch:" + fullname, main.decoded.get, None, fullname)
         
+# timings of each pipeline stage: shown under the picture while the box is ticked, and
+# written as JSON lines to the file named by PHOTOQT_TIMINGS if that is set
+latest_timings = timing.LatestTimings()
+timing_timer = QTimer()
+timing_timer.setInterval(500)
+timing_timer.timeout.connect(lambda: timing_readout.setText(latest_timings.summary()))
+
+def toggleTimings(checked):
+    timing_readout.setVisible(checked)
+    if checked:
+        timing.attach(latest_timings)
+        timing_timer.start()
+    else:
+        timing.detach(latest_timings)
+        timing_timer.stop()
+
+if os.environ.get("PHOTOQT_TIMINGS"):
+    timing.attach(timing.JsonLinesWriter(os.environ["PHOTOQT_TIMINGS"]))
+
 main = Editor()
 
 #   Button Functionalities   
 btn_folder.clicked.connect(getWorkingDirectory) # to display image clicked from the folder
+thumbnail_mode.toggled.connect(toggleThumbnails) # to show the files as thumbnails
+duplicate_mode.toggled.connect(toggleDuplicates) # to show only near-duplicate files, grouped
+btn_quarantine.clicked.connect(quarantineFiles) # to move files that can't be opened out of the folder
+show_timings.toggled.connect(toggleTimings) # to show how long each stage takes
+folder_watcher.directoryChanged.connect(lambda path: rescan_timer.start()) # to notice files added or removed
+rescan_timer.timeout.connect(scanFolder)
 file_list.currentRowChanged.connect(displayImage) # to display chosen image on the window
 filter_box.currentTextChanged.connect(handle_filter) # to display the current text changed filter
+btn_save.clicked.connect(handle_save) # to save the edited image at full resolution
+btn_undo.clicked.connect(handle_undo) # to step back through the edits
+btn_redo.clicked.connect(handle_redo) # to step forward through the edits
 
 gray.clicked.connect(lambda: main.transformImage("B/W"))
 btn_left.clicked.connect(lambda: main.transformImage("Left"))
@@ -252,8 +560,10 @@ sharpness.clicked.connect(lambda: main.transformImage("Sharpen"))
 saturation.clicked.connect(lambda: main.transformImage("Color"))
 contrast.clicked.connect(lambda: main.transformImage("Contrast"))
 blur.clicked.connect(lambda: main.transformImage("Blur"))
+gallery.chosen.connect(main.transformImage) # to apply the filter clicked in the gallery
 
 
 # run quiz_app
 main_widow.show()
-app.exec_()
\ No newline at end of file
+app.exec_()
+main.saves.flush() # write any saves still queued before exiting
\ No newline at end of file
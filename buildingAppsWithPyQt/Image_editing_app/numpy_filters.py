@@ -0,0 +1,82 @@
+# NumPy engine for the B/W, Color and Contrast filters
+# Works on one shared uint8 array, a band of rows at a time, through lookup tables, so any
+# enhance factor can be used without PIL making a full size "degenerate" image for every step.
+import numpy as np
+from PIL import Image
+from filters import transformations, tonal, filter_function, ENHANCE_FACTOR
+
+# pixels handled at once, so the scratch space stays small whatever the image size
+CHUNK_PIXELS = 1 << 20
+
+def row_chunks(array):
+    rows = max(1, CHUNK_PIXELS // max(1, array.shape[1]))
+    for start in range(0, array.shape[0], rows):
+        yield array[start:start + rows]
+
+# the gray level convert("L") gives each pixel (same fixed point maths as PIL)
+def gray_levels(chunk):
+    if chunk.ndim == 2:
+        return chunk
+    r, g, b = (chunk[..., channel].astype(np.uint32) for channel in range(3))
+    return ((r * 19595 + g * 38470 + b * 7471 + 0x8000) >> 16).astype(np.uint8)
+
+# B/W: returns a new 2D array of gray levels
+def gray(array):
+    if array.ndim == 2:
+        return array
+    result = np.empty(array.shape[:2], dtype=np.uint8)
+    for source, target in zip(row_chunks(array), row_chunks(result)):
+        target[...] = gray_levels(source)
+    return result
+
+# what Image.blend gives when pulling value away from center by factor: truncated and clipped
+def blend_table(center, values, factor):
+    return np.clip(center + factor * (values - center), 0, 255).astype(np.uint8)
+
+# Color: mix each pixel away from its own gray level (in place); does nothing to black and white.
+# Uses a 256 x 256 table indexed by (gray level, value) instead of float maths per pixel.
+def color(array, factor=ENHANCE_FACTOR):
+    if array.ndim == 2:
+        return array
+    levels = np.arange(256, dtype=np.float64)
+    table = blend_table(levels[:, None], levels[None, :], factor).ravel()
+    for chunk in row_chunks(array):
+        index = gray_levels(chunk).astype(np.uint16) << 8
+        index = index[..., None] | chunk
+        np.take(table, index, out=chunk)
+    return array
+
+# Contrast: mix every pixel away from the image's mean gray level (in place), through a 256 entry table
+def contrast(array, factor=ENHANCE_FACTOR):
+    total = sum(int(gray_levels(chunk).sum(dtype=np.uint64)) for chunk in row_chunks(array))
+    mean = int(total / (array.shape[0] * array.shape[1]) + 0.5)
+    table = blend_table(float(mean), np.arange(256, dtype=np.float64), factor)
+    for chunk in row_chunks(array):
+        np.take(table, chunk, out=chunk)
+    return array
+
+
+# run a list of filter names, doing B/W, Color and Contrast with NumPy;
+# factors can set the enhance factor for "Color" and "Contrast"
+def apply_operations(image, operations, factors=None):
+    factors = factors or {}
+    array = None # the image as a shared array while tonal steps run
+    for operation in operations:
+        if operation in tonal and image.mode in ("RGB", "L"):
+            if array is None:
+                array = np.array(image) # one copy that every tonal step then updates
+            if operation == "B/W":
+                array = gray(array)
+            elif operation == "Color":
+                color(array, factors.get("Color", ENHANCE_FACTOR))
+            else:
+                contrast(array, factors.get("Contrast", ENHANCE_FACTOR))
+            continue
+        if array is not None:
+            image = Image.fromarray(array)
+            array = None
+        if operation in transformations: # through PIL, for image modes the NumPy engine doesn't handle
+            image = filter_function(operation, factors)(image)
+    if array is not None:
+        image = Image.fromarray(array)
+    return image
@@ -0,0 +1,184 @@
+# Web export: re-encode every image in a folder (normally the edits/ folder) as JPEG or WebP,
+# binary searching the quality for each file so it either fits a size limit or keeps a
+# minimum SSIM (structural similarity) to the saved picture, and report the bytes saved
+# run with: python optimize.py FOLDER --max-kb 300   or   python optimize.py FOLDER --min-ssim 0.98
+import argparse
+import io
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from PIL import Image
+from filters import upright, editable, temp_name
+from batch import find_images
+from frames import is_multiframe
+
+# file extension and PIL format for each output type
+formats = {"jpeg": (".jpg", "JPEG"), "webp": (".webp", "WEBP")}
+
+# range of qualities searched
+LOWEST_QUALITY = 10
+HIGHEST_QUALITY = 95
+
+# side of the square windows SSIM compares
+SSIM_WINDOW = 8
+
+# the image as the encoder would get it: JPEG has no transparency, so that goes onto white
+def prepared(image, image_format):
+    image = editable(upright(image))
+    if image_format == "JPEG" and image.mode == "RGBA":
+        background = Image.new("RGB", image.size, "white")
+        background.paste(image, mask=image.getchannel("A"))
+        image = background
+    return image
+
+def encode(image, image_format, quality):
+    buffer = io.BytesIO()
+    image.save(buffer, image_format, quality=quality)
+    return buffer.getvalue()
+
+# mean SSIM of the gray levels of two images, over SSIM_WINDOW x SSIM_WINDOW windows
+# (only needs NumPy when a minimum SSIM is asked for)
+def ssim(first, second):
+    import numpy as np
+    c1, c2 = (0.01 * 255) ** 2, (0.03 * 255) ** 2
+    a = np.asarray(first.convert("L"), dtype=np.float64)
+    b = np.asarray(second.convert("L"), dtype=np.float64)
+
+    # mean of every window, through a summed-area table
+    def window_means(values):
+        table = np.pad(values.cumsum(0).cumsum(1), ((1, 0), (1, 0)))
+        n = SSIM_WINDOW
+        sums = table[n:, n:] - table[:-n, n:] - table[n:, :-n] + table[:-n, :-n]
+        return sums / (n * n)
+
+    mean_a, mean_b = window_means(a), window_means(b)
+    var_a = window_means(a * a) - mean_a ** 2
+    var_b = window_means(b * b) - mean_b ** 2
+    covariance = window_means(a * b) - mean_a * mean_b
+    values = ((2 * mean_a * mean_b + c1) * (2 * covariance + c2)) / \
+             ((mean_a ** 2 + mean_b ** 2 + c1) * (var_a + var_b + c2))
+    return float(values.mean())
+
+# (quality, encoded bytes): the highest quality that fits max_bytes, or the lowest quality
+# that keeps min_ssim; if nothing qualifies, the closest end of the range
+def search_quality(image, image_format, max_bytes=None, min_ssim=None):
+    def good_enough(quality, data):
+        if max_bytes is not None:
+            return len(data) <= max_bytes
+        with Image.open(io.BytesIO(data)) as decoded:
+            return ssim(image, decoded) >= min_ssim
+
+    low, high = LOWEST_QUALITY, HIGHEST_QUALITY
+    best = None
+    while low <= high:
+        quality = (low + high) // 2
+        data = encode(image, image_format, quality)
+        if good_enough(quality, data):
+            best = (quality, data)
+            if max_bytes is not None:
+                low = quality + 1 # fits: try a better quality
+            else:
+                high = quality - 1 # close enough: try a smaller file
+        elif max_bytes is not None:
+            high = quality - 1
+        else:
+            low = quality + 1
+    if best is None:
+        quality = LOWEST_QUALITY if max_bytes is not None else HIGHEST_QUALITY
+        best = (quality, encode(image, image_format, quality))
+    return best
+
+# runs in a worker process: optimize one file, returning (bytes before, bytes after, quality),
+# or None for animated and multi-page files, which are left as they are. A file is never made
+# bigger: the size limit is at most the file's own size, and if no encoding comes out smaller
+# than a file already in the output format, its own bytes are kept (quality None)
+def optimize_file(source, target, image_format, max_bytes=None, min_ssim=None):
+    if is_multiframe(source):
+        return None
+    size_before = os.path.getsize(source)
+    with Image.open(source) as image:
+        same_format = image.format == image_format
+        image.load()
+        image = prepared(image, image_format)
+    if max_bytes is not None:
+        max_bytes = min(max_bytes, size_before)
+    quality, data = search_quality(image, image_format, max_bytes, min_ssim)
+    if same_format and len(data) >= size_before:
+        with open(source, "rb") as file:
+            quality, data = None, file.read()
+    temp = temp_name(target)
+    with open(temp, "wb") as file:
+        file.write(data)
+    os.replace(temp, target)
+    return size_before, len(data), quality
+
+# output file name for every input: the input's name with the new extension, or with the new
+# extension added where two inputs (a.png and a.jpg) would otherwise be written to the same file
+def output_names(filenames, extension):
+    plain = {name: os.path.splitext(name)[0] + extension for name in filenames}
+    counts = Counter(target.lower() for target in plain.values()) # (Windows and macOS ignore case)
+    return {name: target if counts[target.lower()] == 1 or name.lower() == target.lower() else name + extension
+            for name, target in plain.items()}
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Re-encode images with the smallest quality that meets a target.")
+    parser.add_argument("folder", help="folder with the images to optimize (e.g. the edits folder)")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--max-kb", type=float, help="largest file size allowed, in KB")
+    target.add_argument("--min-ssim", type=float, help="lowest SSIM to the original allowed, e.g. 0.98 (needs NumPy)")
+    parser.add_argument("--format", choices=sorted(formats), default="jpeg", help="output format (default: jpeg)")
+    parser.add_argument("--output", help="where to write the results (default: FOLDER/web)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of worker processes")
+    args = parser.parse_args(argv)
+    if args.output is None:
+        args.output = os.path.join(args.folder, "web")
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    os.makedirs(args.output, exist_ok=True)
+    extension, image_format = formats[args.format]
+    max_bytes = int(args.max_kb * 1024) if args.max_kb is not None else None
+
+    filenames = find_images(args.folder)
+    if not filenames:
+        print("Nothing to do.")
+        return 0
+    targets = output_names(filenames, extension)
+
+    before = after = 0
+    failed = skipped = 0
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = {pool.submit(optimize_file, os.path.join(args.folder, name), os.path.join(args.output, targets[name]),
+                               image_format, max_bytes, args.min_ssim): name
+                   for name in filenames}
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                result = future.result()
+            except Exception as error:
+                failed += 1
+                print(f"Failed: {name}: {error}", file=sys.stderr)
+                continue
+            if result is None:
+                skipped += 1
+                print(f"Skipping {name}: animated and multi-page files are left as they are")
+                continue
+            size_before, size_after, quality = result
+            before += size_before
+            after += size_after
+            encoding = "kept as it was" if quality is None else f"quality {quality}"
+            print(f"{name} -> {targets[name]}: {encoding}, {size_before / 1024:.0f} KB -> {size_after / 1024:.0f} KB")
+
+    elapsed = time.perf_counter() - start
+    saved = before - after
+    percent = 100 * saved / before if before else 0
+    print(f"\n{len(filenames) - failed - skipped} file(s) in {elapsed:.1f}s: {before / 1024:.0f} KB -> {after / 1024:.0f} KB, "
+          f"saved {saved / 1024:.0f} KB ({percent:.0f}%), {skipped} skipped, {failed} failed.")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,63 @@
+# import libraries
+import os
+import threading
+from collections import OrderedDict
+from filters import decode_image
+from edit_stack import image_bytes
+
+# memory budget for decoded images, and how many files either side of the current one to decode ahead
+CACHE_LIMIT = 512 * 1024 * 1024
+PREFETCH_COUNT = 2
+
+# Decoded images (full size + preview) for recently shown and upcoming files,
+# forgetting the least recently used ones when over budget
+class DecodedImageCache():
+    def __init__(self, limit=CACHE_LIMIT, decode=decode_image):
+        self.limit = limit
+        self.decode = decode # decode(fullname) -> (original, proxy)
+        self.size = 0
+        self.entries = OrderedDict() # (path, mtime, file size) -> (original, proxy)
+        self.lock = threading.Lock()
+
+    # key for the current version of a file, so edited files are decoded again
+    def key(self, fullname):
+        stat = os.stat(fullname)
+        return (fullname, stat.st_mtime_ns, stat.st_size)
+
+    # cached (original, proxy) for a file, or None
+    def lookup(self, fullname):
+        try:
+            key = self.key(fullname)
+        except OSError:
+            return None
+        with self.lock:
+            result = self.entries.get(key)
+            if result is not None:
+                self.entries.move_to_end(key)
+            return result
+
+    def __contains__(self, fullname):
+        return self.lookup(fullname) is not None
+
+    # decode a file unless it is already cached; safe to call from worker threads
+    def get(self, fullname):
+        result = self.lookup(fullname)
+        if result is None:
+            key = self.key(fullname)
+            result = self.decode(fullname)
+            self.store(key, result)
+        return result
+
+    def store(self, key, result):
+        original, proxy = result
+        size = image_bytes(original) + image_bytes(proxy)
+        if size > self.limit:
+            return
+        with self.lock:
+            if key in self.entries:
+                return
+            self.entries[key] = result
+            self.size += size
+            while self.size > self.limit:
+                old_key, (old_original, old_proxy) = self.entries.popitem(last=False)
+                self.size -= image_bytes(old_original) + image_bytes(old_proxy)
@@ -0,0 +1,23 @@
+# import libraries
+from PyQt5.QtGui import QImage, QPixmap
+
+# PIL modes that QImage can use as they are, with their bytes per pixel
+QT_FORMATS = {
+    "L": (QImage.Format_Grayscale8, 1),
+    "RGB": (QImage.Format_RGB888, 3),
+    "RGBA": (QImage.Format_RGBA8888, 4),
+}
+
+# turn a PIL image into a QImage without going through a file
+def pil_to_qimage(image):
+    if image.mode not in QT_FORMATS:
+        image = image.convert("RGBA")
+    image_format, bytes_per_pixel = QT_FORMATS[image.mode]
+    data = image.tobytes()
+    qimage = QImage(data, image.width, image.height, image.width * bytes_per_pixel, image_format)
+    qimage.data = data # QImage only points at the bytes, so keep them alive with it
+    return qimage
+
+# turn a PIL image into a QPixmap ready for a QLabel
+def pil_to_qpixmap(image):
+    return QPixmap.fromImage(pil_to_qimage(image))
@@ -0,0 +1,52 @@
+# import libraries
+import sys
+import threading
+import traceback
+
+# Background save queue: saves of the same file are merged so only the newest one is written,
+# one file is never written by two threads at once, and flush() waits for everything queued
+class SaveQueue():
+    def __init__(self, workers=2):
+        self.pending = {} # target path -> (function, args) of the newest save not started yet
+        self.active = set() # target paths being written right now
+        self.condition = threading.Condition()
+        for _ in range(workers):
+            threading.Thread(target=self.work, daemon=True).start()
+
+    # queue function(*args) as the save for target, replacing any save of it still waiting
+    def submit(self, target, function, *args):
+        with self.condition:
+            self.pending.pop(target, None) # drop the older save and queue this one at the back
+            self.pending[target] = (function, args)
+            self.condition.notify_all()
+
+    # the oldest waiting save whose file isn't being written already
+    def next_job(self):
+        for target in self.pending:
+            if target not in self.active:
+                return target, self.pending.pop(target)
+        return None
+
+    def work(self):
+        while True:
+            with self.condition:
+                job = self.next_job()
+                while job is None:
+                    self.condition.wait()
+                    job = self.next_job()
+                target, (function, args) = job
+                self.active.add(target)
+            try:
+                function(*args)
+            except Exception:
+                print("Could not save " + target, file=sys.stderr)
+                traceback.print_exc()
+            finally:
+                with self.condition:
+                    self.active.discard(target)
+                    self.condition.notify_all()
+
+    # wait until every queued save has been written, e.g. before the app closes
+    def flush(self, timeout=None):
+        with self.condition:
+            return self.condition.wait_for(lambda: not self.pending and not self.active, timeout)
@@ -0,0 +1,44 @@
+# import libraries
+import os
+from PyQt5.QtCore import QThread, pyqtSignal
+from filters import is_image_file
+
+# how many file names are sent to the file list at a time
+BATCH_SIZE = 500
+
+# Lists the images in a folder on a background thread, handing them over in batches
+class DirectoryScanner(QThread):
+    found = pyqtSignal(str, list) # folder, file names
+    scanned = pyqtSignal(str, set) # folder, every file name found
+
+    def __init__(self, folder, batch_size=BATCH_SIZE):
+        super().__init__()
+        self.folder = folder
+        self.batch_size = batch_size
+
+    def run(self):
+        batch = []
+        names = set()
+        try:
+            with os.scandir(self.folder) as entries:
+                for entry in entries:
+                    if self.isInterruptionRequested():
+                        return
+                    if not is_image_file(entry.name):
+                        continue
+                    try:
+                        if not entry.is_file():
+                            continue
+                    except OSError:
+                        continue
+                    batch.append(entry.name)
+                    names.add(entry.name)
+                    if len(batch) >= self.batch_size:
+                        self.found.emit(self.folder, batch)
+                        batch = []
+        except OSError:
+            pass
+        if batch:
+            self.found.emit(self.folder, batch)
+        if not self.isInterruptionRequested():
+            self.scanned.emit(self.folder, names)
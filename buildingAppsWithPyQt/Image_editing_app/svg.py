@@ -0,0 +1,72 @@
+# SVG files can't be opened by PIL, so they are drawn with QtSvg at the size they are
+# needed: window size on screen, thumbnail size in the file list, a fixed preview size
+# for the filters, and a larger fixed size when an edited SVG is saved (as PNG).
+import os
+from PyQt5.QtCore import QRectF, QSize, Qt
+from PyQt5.QtGui import QImage, QPainter, QPixmap
+from PyQt5.QtSvg import QSvgRenderer
+from PIL import Image
+from filters import PROXY_MAX_SIZE, decode_image, export_image
+from thumbnails import make_thumbnail
+from timing import stage
+
+# longest side of the picture written when an edited SVG is saved
+SVG_EXPORT_SIZE = 4096
+
+def is_svg(fullname):
+    return os.path.splitext(fullname)[1].lower() == ".svg"
+
+# size of the drawing scaled to fit (width, height), keeping its shape
+def fitted_size(renderer, width, height):
+    size = renderer.defaultSize()
+    if size.isEmpty():
+        size = QSize(width, height)
+    return size.scaled(max(1, width), max(1, height), Qt.KeepAspectRatio)
+
+def open_svg(fullname):
+    renderer = QSvgRenderer(fullname)
+    if not renderer.isValid():
+        raise OSError("cannot read SVG file " + fullname)
+    return renderer
+
+# draw an SVG into a QImage on a white background; QImage (not QPixmap) so it works on worker threads
+def render_qimage(renderer, size):
+    qimage = QImage(size, QImage.Format_RGBA8888)
+    qimage.fill(Qt.white)
+    painter = QPainter(qimage)
+    renderer.render(painter, QRectF(0, 0, size.width(), size.height()))
+    painter.end()
+    return qimage
+
+# an SVG drawn as a PIL RGB image whose longest side is max_size
+def render_svg(fullname, max_size):
+    renderer = open_svg(fullname)
+    size = fitted_size(renderer, max_size, max_size)
+    with stage("rasterize svg", (size.width(), size.height())):
+        qimage = render_qimage(renderer, size)
+        data = qimage.constBits().asstring(qimage.sizeInBytes())
+        image = Image.frombuffer("RGBA", (size.width(), size.height()), data, "raw", "RGBA", qimage.bytesPerLine(), 1)
+        return image.convert("RGB")
+
+# an SVG drawn straight to a pixmap that fits (width, height), for the screen (GUI thread only)
+def render_pixmap(fullname, width, height):
+    renderer = open_svg(fullname)
+    size = fitted_size(renderer, width, height)
+    with stage("rasterize svg", (size.width(), size.height())):
+        return QPixmap.fromImage(render_qimage(renderer, size))
+
+# (original, proxy) like filters.decode_image; for SVG there is no full size original,
+# the filters run on a drawing at preview size
+def decode_file(fullname):
+    if is_svg(fullname):
+        return None, render_svg(fullname, PROXY_MAX_SIZE)
+    return decode_image(fullname)
+
+def make_file_thumbnail(fullname, size):
+    if is_svg(fullname):
+        return render_svg(fullname, size)
+    return make_thumbnail(fullname, size)
+
+# draw the SVG at export size, run the filters and write it to disk
+def export_svg(source, operations, fullname, max_size=SVG_EXPORT_SIZE):
+    return export_image(render_svg(source, max_size), operations, fullname)
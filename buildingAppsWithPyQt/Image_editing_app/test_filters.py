@@ -0,0 +1,89 @@
+# Checks that the merged filter chains of apply_operations give the same pictures as running
+# every filter one after the other, the way the preview does
+# run with: python -m pytest test_filters.py
+import itertools
+import os
+import random
+import unittest
+from PIL import Image, ImageChops
+from filters import transformations, apply_operations, compile_operations
+
+PICTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "image_practice", "customers.png")
+
+# largest difference (in levels) allowed for chains of B/W, Color and Contrast: black and white
+# chains match exactly, RGB Contrast runs can pick a mean one level off after their first step
+TONAL_TOLERANCE = 1
+
+# every filter one after the other, as the EditStack previews do
+def step_by_step(image, operations):
+    for operation in operations:
+        image = transformations[operation](image)
+    return image
+
+# largest difference between two images of the same mode, in levels
+def largest_difference(first, second):
+    extrema = ImageChops.difference(first, second).getextrema()
+    return max(high for low, high in extrema) if isinstance(extrema[0], tuple) else extrema[1]
+
+# random pixels, with a random brightness and spread so clipping happens near black and white too
+def noise_image(seed, mode="RGB"):
+    rng = random.Random(seed)
+    width, height = rng.randrange(5, 120), rng.randrange(5, 120)
+    centre, spread = rng.randrange(256), rng.choice([5, 40, 120])
+    values = bytes(min(255, max(0, int(rng.gauss(centre, spread)))) for _ in range(width * height * 3))
+    return Image.frombytes("RGB", (width, height), values).convert(mode)
+
+class FusedChainTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        with Image.open(PICTURE) as picture:
+            picture = picture.convert("RGB")
+            picture.thumbnail((160, 160))
+        cls.images = [picture, picture.convert("L"), noise_image(1), noise_image(2, "L"), noise_image(3, "RGBA")]
+
+    def assertSameImage(self, fused, naive, tolerance, operations):
+        self.assertEqual((fused.mode, fused.size), (naive.mode, naive.size), operations)
+        self.assertLessEqual(largest_difference(fused, naive), tolerance, operations)
+
+    def test_geometric_chains_are_one_transpose(self):
+        for length in range(1, 5):
+            for operations in itertools.product(["Left", "Right", "Mirror"], repeat=length):
+                self.assertLessEqual(len(compile_operations(operations)), 1, operations)
+
+    def test_geometric_chains_match_exactly(self):
+        for image in self.images:
+            for length in range(1, 5):
+                for operations in itertools.product(["Left", "Right", "Mirror"], repeat=length):
+                    self.assertSameImage(apply_operations(image, operations), step_by_step(image, operations), 0, operations)
+
+    # rotations and flips are moved past Blur, Sharpen and Contrast, which must not change anything
+    def test_mixed_chains_match_exactly(self):
+        rng = random.Random(0)
+        names = ["Left", "Right", "Mirror", "Blur", "Sharpen", "Contrast"]
+        for image in self.images:
+            for _ in range(40):
+                operations = [rng.choice(names) for _ in range(rng.randrange(2, 7))]
+                self.assertSameImage(apply_operations(image, operations), step_by_step(image, operations), 0, operations)
+
+    def test_tonal_chains_within_tolerance(self):
+        for image in self.images:
+            tolerance = 0 if image.mode == "L" else TONAL_TOLERANCE
+            for length in range(1, 5):
+                for operations in itertools.product(["B/W", "Color", "Contrast"], repeat=length):
+                    self.assertSameImage(apply_operations(image, operations), step_by_step(image, operations),
+                                         tolerance, operations)
+
+    def test_long_tonal_chains_within_tolerance(self):
+        rng = random.Random(1)
+        for seed in range(10, 30):
+            image = noise_image(seed)
+            for _ in range(10):
+                operations = [rng.choice(["B/W", "Color", "Contrast", "Contrast"]) for _ in range(rng.randrange(2, 9))]
+                self.assertSameImage(apply_operations(image, operations), step_by_step(image, operations),
+                                     TONAL_TOLERANCE, operations)
+
+    def test_contrast_run_is_one_pass(self):
+        self.assertEqual(len(compile_operations(["Contrast"] * 5)), 1)
+
+if __name__ == "__main__":
+    unittest.main()
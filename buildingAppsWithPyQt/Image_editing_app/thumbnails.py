@@ -0,0 +1,80 @@
+# import libraries
+import hashlib
+import os
+import threading
+from PIL import Image
+from filters import upright, open_large, large_preview, LARGE_IMAGE_PIXELS
+
+# where thumbnails are kept between runs, and how much disk they may use
+CACHE_FOLDER = os.path.join(os.path.expanduser("~"), ".cache", "photoqt", "thumbnails")
+CACHE_LIMIT = 200 * 1024 * 1024
+THUMBNAIL_SIZE = 128
+
+# make a small copy of an image file, asking JPEG to decode at a reduced scale
+# (very large files go the way of the Editor's preview, so they are never decoded in full)
+def make_thumbnail(fullname, size=THUMBNAIL_SIZE):
+    with open_large(fullname) as image:
+        if image.width * image.height > LARGE_IMAGE_PIXELS:
+            return large_preview(fullname, size)
+        image.draft("RGB", (size, size)) # only does something for JPEG files
+        image.thumbnail((size, size))
+        image = upright(image)
+        if image.mode not in ("RGB", "RGBA", "L"):
+            image = image.convert("RGBA")
+        return image.copy()
+
+# On-disk thumbnail cache keyed by path, modification time and file size,
+# forgetting the least recently used thumbnails when it grows past its limit
+class ThumbnailCache():
+    def __init__(self, folder=CACHE_FOLDER, limit=CACHE_LIMIT, size=THUMBNAIL_SIZE, make=make_thumbnail):
+        self.folder = folder
+        self.make = make # make(fullname, size) for files not cached yet
+        self.limit = limit
+        self.size = size
+        self.lock = threading.Lock()
+        os.makedirs(self.folder, exist_ok=True)
+        self.total = sum(entry.stat().st_size for entry in os.scandir(self.folder) if entry.is_file())
+
+    # cache file name for the current version of an image file
+    def key(self, fullname):
+        stat = os.stat(fullname)
+        text = f"{os.path.abspath(fullname)}|{stat.st_mtime_ns}|{stat.st_size}|{self.size}"
+        return os.path.join(self.folder, hashlib.sha1(text.encode()).hexdigest() + ".png")
+
+    # get the thumbnail for a file, making and storing it if it is not cached yet
+    def get(self, fullname):
+        cached = self.key(fullname)
+        try:
+            with Image.open(cached) as image:
+                image.load()
+            os.utime(cached) # mark as recently used
+            return image
+        except OSError:
+            pass
+        image = self.make(fullname, self.size)
+        self.store(cached, image)
+        return image
+
+    def store(self, cached, image):
+        temp = f"{cached}.{threading.get_ident()}.tmp"
+        image.save(temp, "PNG")
+        os.replace(temp, cached)
+        with self.lock:
+            self.total += os.path.getsize(cached)
+            if self.total > self.limit:
+                self.evict()
+
+    # delete the least recently used thumbnails until the cache is back under 90% of its limit
+    def evict(self):
+        entries = [entry for entry in os.scandir(self.folder) if entry.is_file()]
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        self.total = sum(entry.stat().st_size for entry in entries)
+        for entry in entries:
+            if self.total <= self.limit * 0.9:
+                break
+            try:
+                size = entry.stat().st_size
+                os.remove(entry.path)
+                self.total -= size
+            except OSError:
+                pass
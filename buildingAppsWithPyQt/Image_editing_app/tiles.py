@@ -0,0 +1,351 @@
+# Tiled processing for very large images: the filters run on one tile at a time and
+# each finished tile goes straight into the output file, so memory stays under a budget
+# run with: python tiles.py INPUT OUTPUT.ppm --filters Left,Blur,Contrast [--memory 256]
+import argparse
+import io
+import math
+import os
+import struct
+import sys
+from PIL import Image, ImageStat, TiffImagePlugin, TiffTags
+from filters import transformations, geometric, fuse_geometry, orientation_method, temp_name, open_large, ENHANCE_FACTOR
+
+# default memory budget for the tiles in flight (bytes)
+MEMORY_BUDGET = 256 * 1024 * 1024
+
+# bytes PIL keeps per pixel of an RGB (or, rounded up, black and white) image
+BYTES_PER_PIXEL = 4
+
+# smallest tile side worth the overhead of a tile
+MIN_TILE_SIDE = 64
+
+# TIFF tags a strip or tile needs to be decoded on its own (sample layout, compression, colours)
+piece_tags = {258, 259, 262, 266, 277, 284, 292, 293, 317, 320, 338, 339, 347, 530, 531, 532}
+
+# how many pixels past a tile edge each filter reads, so tile edges come out the same as a full image
+margins = {"Blur": 2, "Sharpen": 1}
+
+# where a box ends up after image.transpose(method) on an image of the given size
+def transpose_box(box, method, size):
+    x0, y0, x1, y1 = box
+    width, height = size
+    boxes = {
+        None: (x0, y0, x1, y1),
+        Image.FLIP_LEFT_RIGHT: (width - x1, y0, width - x0, y1),
+        Image.FLIP_TOP_BOTTOM: (x0, height - y1, x1, height - y0),
+        Image.ROTATE_180: (width - x1, height - y1, width - x0, height - y0),
+        Image.ROTATE_90: (y0, width - x1, y1, width - x0),
+        Image.ROTATE_270: (height - y1, x0, height - y0, x1),
+        Image.TRANSPOSE: (y0, x0, y1, x1),
+        Image.TRANSVERSE: (height - y1, width - x1, height - y0, width - x0),
+    }
+    return boxes[method]
+
+# the mode a source is read in: black and white kinds as L, everything else as RGB
+def source_mode(image_mode):
+    return "L" if image_mode in ("1", "L", "I", "F") else "RGB"
+
+# the mode process_tiled writes for a source of the given mode
+def output_mode(image_mode, operations):
+    return "L" if source_mode(image_mode) == "L" or "B/W" in operations else "RGB"
+
+# the file extension process_tiled's output gets: .pgm for black and white, else .ppm
+def output_extension(fullname, operations):
+    with open_large(fullname) as image:
+        return ".pgm" if output_mode(image.mode, operations) == "L" else ".ppm"
+
+# one strip or tile of a TIFF file, wrapped as a TIFF file with just that strip so PIL decodes
+# only that part, whatever the compression
+def piece_file(tags, data, size):
+    directory = TiffImagePlugin.ImageFileDirectory_v2(prefix=tags.prefix)
+    for tag in piece_tags & set(tags):
+        directory[tag] = tags[tag]
+        directory.tagtype[tag] = tags.tagtype[tag]
+    # (PIL moves the strip offset past the directory itself, which is where the strip goes)
+    for tag, value in ((256, size[0]), (257, size[1]), (278, size[1]), (279, len(data)), (273, 0)):
+        directory[tag] = value
+        directory.tagtype[tag] = TiffTags.LONG
+    order = "<" if tags.prefix == b"II" else ">"
+    header = tags.prefix + struct.pack(order + "HI", 42, 8)
+    return Image.open(io.BytesIO(header + directory.tobytes(8) + data))
+
+# Reads parts of an image file. Uncompressed files (PPM/PGM, BMP, raw TIFF) are read a tile at
+# a time straight from disk, and TIFFs stored in strips or tiles only have the strips or tiles
+# covering each part decoded. Other files (JPEG, PNG, ...) are one compressed stream that can
+# only be decoded in full, so they can't be read in parts at all.
+class TileSource():
+    def __init__(self, fullname):
+        self.image = open_large(fullname)
+        self.size = self.image.size
+        if self.image.format == "TIFF": # as stored: PIL swaps the sides of TIFFs marked as turned
+            self.size = (self.image.tag_v2[256], self.image.tag_v2[257])
+        self.mode = source_mode(self.image.mode)
+        self.orientation = None # transpose that turns it the right way up
+        self.file = None
+        self.pieces = None # (box, file offset, byte count, stored size) of every TIFF strip or tile
+        tiles = self.image.tile
+        if len(tiles) == 1 and tiles[0][0] == "raw" and tiles[0][1] == (0, 0) + self.size:
+            args = tiles[0][3]
+            args = (args,) if isinstance(args, str) else tuple(args)
+            rawmode, stride, orientation = (args + (0, 1)[len(args) - 1:])[:3] # stride and orientation are optional
+            if rawmode in ("RGB", "BGR", "L") and orientation in (1, -1):
+                self.rawmode = rawmode
+                self.offset = tiles[0][2]
+                self.bytes_per_pixel = len(rawmode)
+                self.stride = stride or self.size[0] * self.bytes_per_pixel
+                self.row_order = orientation # -1 means the rows are stored bottom up (BMP)
+                self.file = open(fullname, "rb")
+        if self.file is None and self.image.format == "TIFF" and self.image.tag_v2.get(284, 1) == 1:
+            self.read_layout(self.image.tag_v2) # (not for one plane per channel)
+            self.file = open(fullname, "rb")
+        if self.file is not None: # (PNG reads its EXIF by decoding the whole image)
+            self.orientation = orientation_method(self.image)
+
+    # where every strip or tile of a TIFF is, in the order the file lists them
+    def read_layout(self, tags):
+        width, height = self.size
+        if 324 in tags: # tiles: always stored at full tile size, even past the image edges
+            piece_width, piece_height = tags[322], tags[323]
+            offsets, counts = tags[324], tags[325]
+        else: # strips: full width, the last one only as tall as the rows left
+            piece_width, piece_height = width, min(tags.get(278, height), height)
+            offsets, counts = tags[273], tags[279]
+        self.piece_size = (piece_width, piece_height)
+        self.across = math.ceil(width / piece_width)
+        self.pieces = []
+        for index, (offset, count) in enumerate(zip(offsets, counts)):
+            x0, y0 = index % self.across * piece_width, index // self.across * piece_height
+            box = (x0, y0, min(x0 + piece_width, width), min(y0 + piece_height, height))
+            stored = self.piece_size if 324 in tags else (width, box[3] - y0)
+            self.pieces.append((box, offset, count, stored))
+        self.decoded = {} # index -> decoded strip or tile, for the ones the last read used
+
+    # pixels of strips or tiles decoded at once to read a square of the given side
+    def decoded_area(self, side):
+        if self.pieces is None:
+            return 0
+        piece_width, piece_height = self.piece_size
+        columns = min(self.size[0], side + 2 * piece_width)
+        return columns * min(self.size[1], side + 2 * piece_height)
+
+    # whether the file can be read in parts, with the smallest tile fitting the budget
+    def fits(self, budget):
+        return self.file is not None and self.decoded_area(MIN_TILE_SIDE) * BYTES_PER_PIXEL <= budget // 2
+
+    def read(self, box):
+        if self.pieces is not None:
+            return self.read_pieces(box)
+        x0, y0, x1, y1 = box
+        rows = []
+        for y in range(y0, y1):
+            row = y if self.row_order == 1 else self.size[1] - 1 - y
+            self.file.seek(self.offset + row * self.stride + x0 * self.bytes_per_pixel)
+            rows.append(self.file.read((x1 - x0) * self.bytes_per_pixel))
+        mode = "L" if self.rawmode == "L" else "RGB"
+        return Image.frombytes(mode, (x1 - x0, y1 - y0), b"".join(rows), "raw", self.rawmode).convert(self.mode)
+
+    # put a part together from the strips or tiles it covers; these are kept until a read
+    # no longer needs them, so the tiles along one row share the decoded strips
+    def read_pieces(self, box):
+        x0, y0, x1, y1 = box
+        piece_width, piece_height = self.piece_size
+        needed = [row * self.across + column
+                  for row in range(y0 // piece_height, (y1 - 1) // piece_height + 1)
+                  for column in range(x0 // piece_width, (x1 - 1) // piece_width + 1)]
+        for index in set(self.decoded) - set(needed): # let go of these before decoding more
+            del self.decoded[index]
+        for index in needed:
+            if index not in self.decoded:
+                self.decoded[index] = self.decode_piece(index)
+        tile = Image.new(self.mode, (x1 - x0, y1 - y0))
+        for index in needed:
+            px0, py0, px1, py1 = self.pieces[index][0]
+            part = (max(x0, px0), max(y0, py0), min(x1, px1), min(y1, py1))
+            piece = self.decoded[index].crop((part[0] - px0, part[1] - py0, part[2] - px0, part[3] - py0))
+            tile.paste(piece, (part[0] - x0, part[1] - y0))
+        return tile
+
+    def decode_piece(self, index):
+        box, offset, count, stored = self.pieces[index]
+        self.file.seek(offset)
+        with piece_file(self.image.tag_v2, self.file.read(count), stored) as piece:
+            return piece.crop((0, 0, box[2] - box[0], box[3] - box[1])).convert(self.mode)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+        self.image.close()
+
+# whether process_tiled can work on a file within the memory budget
+def can_process_tiled(fullname, budget=MEMORY_BUDGET):
+    source = TileSource(fullname)
+    try:
+        return source.fits(budget)
+    finally:
+        source.close()
+
+# Writes a binary PPM (colour) or PGM (black and white) file one tile at a time, in any order
+class TileWriter():
+    def __init__(self, fullname, size, mode):
+        self.size = size
+        self.bytes_per_pixel = 1 if mode == "L" else 3
+        header = b"%s\n%d %d\n255\n" % (b"P5" if mode == "L" else b"P6", size[0], size[1])
+        self.offset = len(header)
+        self.file = open(fullname, "wb")
+        self.file.write(header)
+        self.file.truncate(self.offset + size[0] * size[1] * self.bytes_per_pixel)
+
+    def write(self, box, tile):
+        x0, y0, x1, y1 = box
+        data = tile.tobytes()
+        row_bytes = (x1 - x0) * self.bytes_per_pixel
+        for row in range(y1 - y0):
+            self.file.seek(self.offset + ((y0 + row) * self.size[0] + x0) * self.bytes_per_pixel)
+            self.file.write(data[row * row_bytes:(row + 1) * row_bytes])
+
+    def close(self):
+        self.file.close()
+
+# Contrast with the mean of the whole image rather than of one tile
+def contrast_with_mean(tile, mean):
+    degenerate = Image.new("L", tile.size, mean).convert(tile.mode)
+    return Image.blend(degenerate, tile, ENHANCE_FACTOR)
+
+# run (filter name, contrast mean) steps on a tile
+def run_steps(tile, steps):
+    for operation, mean in steps:
+        if operation == "Contrast":
+            tile = contrast_with_mean(tile, mean)
+        else:
+            tile = transformations[operation](tile)
+    return tile
+
+# largest square tile whose copies in flight (source, a few in-between results), and the
+# strips or tiles of the file decoded to read it, fit the budget
+def tile_side(budget, margin, source=None, bytes_per_pixel=BYTES_PER_PIXEL, copies=4):
+    def cost(side):
+        read_side = side + 2 * margin
+        area = copies * read_side * read_side + (source.decoded_area(read_side) if source else 0)
+        return area * bytes_per_pixel
+
+    low, high = 1, int(math.sqrt(budget / (bytes_per_pixel * copies)))
+    while low < high: # the largest side that still fits
+        middle = (low + high + 1) // 2
+        if cost(middle) <= budget:
+            low = middle
+        else:
+            high = middle - 1
+    return max(MIN_TILE_SIDE, low)
+
+# every tile box of an image, with the box of the surrounding margin to read
+def tile_boxes(size, side, margin):
+    width, height = size
+    for y0 in range(0, height, side):
+        for x0 in range(0, width, side):
+            box = (x0, y0, min(x0 + side, width), min(y0 + side, height))
+            read_box = (max(0, box[0] - margin), max(0, box[1] - margin),
+                        min(width, box[2] + margin), min(height, box[3] + margin))
+            yield box, read_box
+
+# read a tile with its margin, filter it, then cut the margin off again
+def filtered_tile(source, steps, box, read_box):
+    tile = run_steps(source.read(read_box), steps)
+    return tile.crop((box[0] - read_box[0], box[1] - read_box[1],
+                      box[2] - read_box[0], box[3] - read_box[1]))
+
+# mean gray level of the image after the given steps, one tile at a time
+def measure_mean(source, steps, side, margin):
+    total = 0
+    for box, read_box in tile_boxes(source.size, side, margin):
+        tile = filtered_tile(source, steps, box, read_box).convert("L")
+        stat = ImageStat.Stat(tile)
+        total += stat.sum[0]
+    return int(total / (source.size[0] * source.size[1]) + 0.5)
+
+# a copy of an image file no bigger than max_size on either side, turned the right way up,
+# made by shrinking one tile at a time into it, so the file is never decoded in full
+def tiled_preview(fullname, max_size, budget=MEMORY_BUDGET):
+    source = TileSource(fullname)
+    try:
+        width, height = source.size
+        scale = min(1.0, max_size / max(width, height))
+        size = (max(1, round(width * scale)), max(1, round(height * scale)))
+        preview = Image.new(source.mode, size)
+        for box, read_box in tile_boxes(source.size, tile_side(budget, 0, source), 0):
+            # where the tile lands in the preview, rounded the same way on both sides of every edge
+            target = (box[0] * size[0] // width, box[1] * size[1] // height,
+                      box[2] * size[0] // width, box[3] * size[1] // height)
+            if target[2] > target[0] and target[3] > target[1]:
+                tile = source.read(box).resize((target[2] - target[0], target[3] - target[1]), Image.BOX)
+                preview.paste(tile, target[:2])
+    finally:
+        source.close()
+    return preview if source.orientation is None else preview.transpose(source.orientation)
+
+# filter a whole image file tile by tile into a PPM/PGM file, keeping memory under budget;
+# rotations and flips (including turning the picture the right way up from EXIF) are moved
+# to the end, as every filter is symmetric under them, and done per tile
+def process_tiled(source_name, target_name, operations, budget=MEMORY_BUDGET, progress=None):
+    operations = [operation for operation in operations if operation in transformations]
+    names = [operation for operation in operations if operation not in geometric]
+    margin = sum(margins.get(operation, 0) for operation in names)
+    source = TileSource(source_name)
+    try:
+        if not source.fits(budget):
+            raise ValueError(f"{source_name} can't be read in parts within the memory budget "
+                             "(only uncompressed files and TIFFs stored in strips or tiles can)")
+        method = fuse_geometry([operation for operation in operations if operation in geometric], first=source.orientation)
+        side = tile_side(budget, margin, source)
+
+        # Contrast needs the mean of the whole image at that point, so measure it first
+        steps = []
+        for operation in names:
+            mean = measure_mean(source, steps, side, margin) if operation == "Contrast" else None
+            steps.append((operation, mean))
+
+        mode = output_mode(source.image.mode, names)
+        width, height = source.size
+        size = (height, width) if method in (Image.ROTATE_90, Image.ROTATE_270, Image.TRANSPOSE, Image.TRANSVERSE) else (width, height)
+        temp = temp_name(target_name) # renamed to the real name only once every tile is written
+        writer = TileWriter(temp, size, mode)
+        try:
+            boxes = list(tile_boxes(source.size, side, margin))
+            for done, (box, read_box) in enumerate(boxes, 1):
+                tile = filtered_tile(source, steps, box, read_box)
+                if method is not None:
+                    tile = tile.transpose(method)
+                writer.write(transpose_box(box, method, source.size), tile)
+                if progress:
+                    progress(done, len(boxes))
+        except Exception:
+            writer.close()
+            os.remove(temp)
+            raise
+        writer.close()
+        os.replace(temp, target_name)
+    finally:
+        source.close()
+    return target_name
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Filter a very large image tile by tile into a PPM/PGM file.")
+    parser.add_argument("source")
+    parser.add_argument("target", help="output file (.ppm for colour, .pgm for black and white)")
+    parser.add_argument("--filters", required=True, help="comma separated filter chain, e.g. Left,Blur,Contrast")
+    parser.add_argument("--memory", type=int, default=MEMORY_BUDGET // (1024 * 1024), help="memory budget for tiles in MB")
+    args = parser.parse_args(argv)
+    operations = [name.strip() for name in args.filters.split(",") if name.strip()]
+    unknown = [name for name in operations if name not in transformations]
+    if unknown:
+        parser.error("unknown filter(s): " + ", ".join(unknown))
+    Image.MAX_IMAGE_PIXELS = None # gigapixel images are the point here
+    if not can_process_tiled(args.source, args.memory * 1024 * 1024):
+        parser.error(f"{args.source} can't be read in parts within the memory budget "
+                     "(only uncompressed files and TIFFs stored in strips or tiles can)")
+    process_tiled(args.source, args.target, operations, args.memory * 1024 * 1024,
+                  progress=lambda done, total: print(f"\r{done}/{total} tiles", end="", flush=True))
+    print()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,116 @@
+# Optional timing of the editing pipeline (decode, each filter, encode, pixmap and scaling).
+# Code wraps a stage in `with stage("decode", image.size):`; while no collector is attached
+# that returns a shared do-nothing context, so the cost is one list check.
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError: # Windows
+    resource = None
+
+# functions called with a record dict after every stage; empty means timing is off
+collectors = []
+
+NO_TIMING = contextlib.nullcontext()
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+# memory the process uses right now in bytes (peak so far where /proc isn't available,
+# None where neither can be read)
+def memory_used():
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * PAGE_SIZE
+    except OSError:
+        if resource is None:
+            return None
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+# Times one stage and hands the record to every collector. The memory change is for the
+# whole process, so stages running at the same time on other threads show up in it too.
+class Stage():
+    __slots__ = ("name", "size", "start", "memory")
+
+    def __init__(self, name, size):
+        self.name = name
+        self.size = size
+
+    def __enter__(self):
+        self.memory = memory_used()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        seconds = time.perf_counter() - self.start
+        memory = memory_used()
+        known = memory is not None and self.memory is not None
+        record = {
+            "stage": self.name,
+            "seconds": round(seconds, 6),
+            "size": list(self.size) if self.size else None,
+            "memory_mb": round(memory / 2**20, 1) if known else None,
+            "memory_change_mb": round((memory - self.memory) / 2**20, 1) if known else None,
+            "thread": threading.current_thread().name,
+            "time": time.time(),
+            "failed": exc_info[0] is not None,
+        }
+        for collector in list(collectors):
+            collector(record)
+        return False
+
+# context manager timing one stage; size is the (width, height) of the image it works on
+def stage(name, size=None):
+    if not collectors:
+        return NO_TIMING
+    return Stage(name, size)
+
+def attach(collector):
+    collectors.append(collector)
+
+def detach(collector):
+    if collector in collectors:
+        collectors.remove(collector)
+
+# Appends every record to a file as one JSON object per line, for offline analysis
+class JsonLinesWriter():
+    def __init__(self, fullname):
+        self.file = open(fullname, "a")
+        self.lock = threading.Lock()
+
+    def __call__(self, record):
+        line = json.dumps(record)
+        with self.lock:
+            self.file.write(line + "\n")
+            self.file.flush()
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+# Keeps the newest record of every stage, for an on-screen readout
+class LatestTimings():
+    def __init__(self):
+        self.records = {} # stage -> newest record
+        self.lock = threading.Lock()
+
+    def __call__(self, record):
+        with self.lock:
+            self.records[record["stage"]] = record
+
+    # one line per stage, slowest first
+    def summary(self):
+        with self.lock:
+            records = sorted(self.records.values(), key=lambda record: -record["seconds"])
+        lines = []
+        for record in records:
+            size = "x".join(str(side) for side in record["size"]) if record["size"] else "-"
+            change = record["memory_change_mb"]
+            lines.append(f"{record['stage']}: {record['seconds'] * 1000:.1f} ms, {size}"
+                         + (f", {change:+.1f} MB" if change is not None else ""))
+        return "\n".join(lines)
@@ -0,0 +1,147 @@
+# Checks the image files in a folder before anyone clicks them: the first bytes must say
+# what kind of image it is (whatever the extension claims), and PIL's verify() must get
+# through the file without finding damage (JPEGs that don't end where expected are decoded
+# too). Results are kept on disk per path, modification time and size, so a folder is only
+# checked again where it changed. Bad files can be
+# moved aside into a quarantine folder, with a log of what was moved and why.
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import xml.etree.ElementTree as ElementTree
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+from filters import open_large, PROXY_MAX_SIZE
+
+# where the results are kept between runs, and the folder (inside the image folder) bad files go to
+INDEX_FILE = os.path.join(os.path.expanduser("~"), ".cache", "photoqt", "validation.sqlite")
+QUARANTINE_FOLDER = "quarantine"
+QUARANTINE_LOG = "quarantine.jsonl"
+
+# raised whenever check_file changes, so results of older checks are thrown away
+CHECK_VERSION = 2
+
+# what each file type starts with, and the extensions it may have
+signatures = [
+    (b"\xff\xd8\xff", "JPEG"),
+    (b"\x89PNG\r\n\x1a\n", "PNG"),
+    (b"GIF87a", "GIF"),
+    (b"GIF89a", "GIF"),
+    (b"II*\x00", "TIFF"),
+    (b"MM\x00*", "TIFF"),
+]
+kind_extensions = {
+    "JPEG": {".jpg", ".jpeg"},
+    "PNG": {".png"},
+    "GIF": {".gif"},
+    "TIFF": {".tif", ".tiff"},
+    "SVG": {".svg"},
+}
+
+# file statuses: fine, opens but the extension is wrong, can't be opened
+OK = "ok"
+MISLABELED = "mislabeled"
+CORRUPT = "corrupt"
+
+# what kind of image the first bytes say it is, or None
+def sniff(head):
+    for signature, kind in signatures:
+        if head.startswith(signature):
+            return kind
+    text = head.lstrip(b"\xef\xbb\xbf \t\r\n").lower()
+    if text.startswith(b"<") and b"<svg" in text:
+        return "SVG"
+    return None
+
+# whether a JPEG's end-of-image marker is in its last KB, as it is for nearly every JPEG
+def ends_jpeg(fullname):
+    with open(fullname, "rb") as file:
+        file.seek(max(0, os.path.getsize(fullname) - 1024))
+        return b"\xff\xd9" in file.read()
+
+# (status, reason) for one file
+def check_file(fullname):
+    with open(fullname, "rb") as file:
+        head = file.read(1024)
+    kind = sniff(head)
+    if kind is None:
+        return CORRUPT, "not an image file"
+    try:
+        if kind == "SVG":
+            ElementTree.parse(fullname)
+        else:
+            with open_large(fullname) as image:
+                image.verify() # checks the structure (and PNG checksums) without decoding the pixels
+            if kind == "JPEG" and not ends_jpeg(fullname):
+                # cut off, or with extra data after the picture (motion photos, maker notes):
+                # only decoding tells them apart; at reduced scale, as the preview is decoded
+                with open_large(fullname) as image:
+                    image.draft("RGB", (PROXY_MAX_SIZE, PROXY_MAX_SIZE))
+                    image.load()
+    except Exception as error:
+        return CORRUPT, f"damaged {kind}: {error}"
+    if os.path.splitext(fullname)[1].lower() not in kind_extensions[kind]:
+        return MISLABELED, f"actually a {kind} file"
+    return OK, ""
+
+# Validation results for files on disk, keyed by path, modification time and file size
+class ValidationCache():
+    def __init__(self, fullname=INDEX_FILE):
+        os.makedirs(os.path.dirname(fullname), exist_ok=True)
+        self.connection = sqlite3.connect(fullname, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock, self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS results (path TEXT PRIMARY KEY, mtime INTEGER, "
+                                    "size INTEGER, status TEXT, reason TEXT)")
+            if self.connection.execute("PRAGMA user_version").fetchone()[0] < CHECK_VERSION:
+                self.connection.execute("DELETE FROM results")
+                self.connection.execute(f"PRAGMA user_version = {CHECK_VERSION}")
+
+    # (status, reason) for a file, checking it only if it changed since last time
+    def get(self, fullname):
+        stat = os.stat(fullname)
+        with self.lock:
+            row = self.connection.execute("SELECT mtime, size, status, reason FROM results WHERE path = ?",
+                                          (fullname,)).fetchone()
+        if row is not None and row[0] == stat.st_mtime_ns and row[1] == stat.st_size:
+            return row[2], row[3]
+        result = check_file(fullname)
+        with self.lock, self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)",
+                                    (fullname, stat.st_mtime_ns, stat.st_size) + result)
+        return result
+
+# {file name: (status, reason)} for every file that isn't fine, checked in parallel
+def validate_folder(folder, filenames, cache, workers=None):
+    def check(filename):
+        try:
+            return filename, cache.get(os.path.join(folder, filename))
+        except OSError as error: # gone or unreadable
+            return filename, (CORRUPT, str(error))
+
+    with ThreadPoolExecutor(workers or os.cpu_count()) as pool: # reading and verifying let go of the GIL
+        return {name: result for name, result in pool.map(check, filenames) if result[0] != OK}
+
+# move bad files into the quarantine folder, appending a line per file to its log;
+# returns the names that were moved
+def quarantine(folder, problems):
+    target_folder = os.path.join(folder, QUARANTINE_FOLDER)
+    os.makedirs(target_folder, exist_ok=True)
+    moved = []
+    with open(os.path.join(target_folder, QUARANTINE_LOG), "a") as log:
+        for filename, (status, reason) in problems.items():
+            source = os.path.join(folder, filename)
+            target = os.path.join(target_folder, filename)
+            if os.path.exists(target): # an earlier file of the same name is already there
+                root, ext = os.path.splitext(filename)
+                target = os.path.join(target_folder, f"{root}.{time.time_ns()}{ext}")
+            try:
+                shutil.move(source, target)
+            except OSError:
+                continue
+            log.write(json.dumps({"time": time.time(), "file": source, "moved_to": target,
+                                  "status": status, "reason": reason}) + "\n")
+            moved.append(filename)
+    return moved
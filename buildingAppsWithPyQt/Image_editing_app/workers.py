@@ -0,0 +1,89 @@
+# import libraries
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal, pyqtSlot
+
+# Signals a worker uses to hand its result back to the GUI thread
+class WorkerSignals(QObject):
+    finished = pyqtSignal(object, int, object) # channel, generation, result
+    failed = pyqtSignal(object, int, str) # channel, generation, error message
+
+# Runs one function on the thread pool
+class Worker(QRunnable):
+    def __init__(self, channel, generation, function, args):
+        super().__init__()
+        self.setAutoDelete(False)
+        self.channel = channel
+        self.generation = generation
+        self.function = function
+        self.args = args
+        self.signals = WorkerSignals()
+
+    def run(self):
+        try:
+            result = self.function(*self.args)
+        except Exception as error:
+            self.signals.failed.emit(self.channel, self.generation, str(error))
+        else:
+            self.signals.finished.emit(self.channel, self.generation, result)
+
+# Sends work to a thread pool, keeping only the newest request on each channel. Each runner
+# gets a pool of its own unless one is passed in: Qt uses the global pool for its own work
+# (e.g. smooth scaling), which must not wait behind Python workers holding up the GIL.
+class TaskRunner(QObject):
+    def __init__(self, pool=None):
+        super().__init__()
+        self.pool = pool or QThreadPool()
+        self.generations = {} # channel -> number of the newest request
+        self.pending = {} # channel -> newest worker, which may still be waiting for its turn
+        self.workers = {} # (channel, generation) -> (worker, on_done, on_error), kept until it finishes
+
+    # run function(*args) in the background and call on_done(result) on the GUI thread,
+    # unless a newer request on the same channel came in first
+    def submit(self, channel, function, on_done, *args, on_error=None):
+        self.cancel(channel)
+        generation = self.generations[channel]
+        worker = Worker(channel, generation, function, args)
+        worker.signals.finished.connect(self.deliver)
+        worker.signals.failed.connect(self.report)
+        self.pending[channel] = worker
+        self.workers[(channel, generation)] = (worker, on_done, on_error)
+        self.pool.start(worker)
+        return generation
+
+    # drop whatever is queued on a channel; running work is ignored when it finishes
+    def cancel(self, channel):
+        self.generations[channel] = self.generations.get(channel, 0) + 1
+        worker = self.pending.pop(channel, None)
+        if worker is not None and self.pool.tryTake(worker):
+            del self.workers[(channel, worker.generation)]
+
+    # drop everything queued or running on every channel
+    def cancel_all(self):
+        for channel in list(self.generations):
+            self.cancel(channel)
+
+    def is_current(self, channel, generation):
+        return self.generations.get(channel) == generation
+
+    @pyqtSlot(object, int, object)
+    def deliver(self, channel, generation, result):
+        on_done, on_error = self.finish(channel, generation)
+        if on_done and self.is_current(channel, generation):
+            on_done(result)
+
+    @pyqtSlot(object, int, str)
+    def report(self, channel, generation, message):
+        on_done, on_error = self.finish(channel, generation)
+        if on_error and self.is_current(channel, generation):
+            on_error(message)
+
+    # forget a request once its worker is done
+    def finish(self, channel, generation):
+        worker = self.pending.get(channel)
+        if worker is not None and worker.generation == generation:
+            del self.pending[channel]
+        worker, on_done, on_error = self.workers.pop((channel, generation), (None, None, None))
+        return on_done, on_error
+
+    # wait for every running worker, e.g. before the app closes
+    def wait(self, msecs=-1):
+        return self.pool.waitForDone(msecs)
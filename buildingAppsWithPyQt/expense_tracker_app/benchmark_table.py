@@ -0,0 +1,84 @@
+# Benchmark: time to add and delete single expenses as the table grows, through the same
+# ExpenseApp methods the buttons use (the row is inserted into/removed from the model, the
+# table is not read again), next to what a full reload of the table costs, and the time to
+# show one month (of one category) through the filter controls
+# run with: python benchmark_table.py [rows ...]   (default: 1000 10000 100000 1000000)
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen") # no window needed
+from PyQt5.QtWidgets import QApplication
+from PyQt5.QtCore import QDate
+
+SIZES = [1_000, 10_000, 100_000, 1_000_000]
+OPERATIONS = 200
+CATEGORIES = ["Food", "Transportation", "Rent", "Shopping", "Entertainment", "Bills", "Others"]
+
+# an expenses table with the given number of random rows, made straight through sqlite3
+def make_database(fullname, rows):
+    connection = sqlite3.connect(fullname)
+    connection.execute("CREATE TABLE expenses (id INTEGER PRIMARY KEY AUTOINCREMENT, date TEXT, "
+                       "category TEXT, amount REAL, description TEXT)")
+    connection.executemany("INSERT INTO expenses (date, category, amount, description) VALUES (?, ?, ?, ?)",
+                           ((f"20{random.randint(10, 25)}-{random.randint(1, 12):02d}-{random.randint(1, 28):02d}",
+                             random.choice(CATEGORIES), round(random.uniform(1, 500), 2), f"expense {number}")
+                            for number in range(rows)))
+    connection.commit()
+    connection.close()
+
+# (median, 95th percentile) in milliseconds of running function `count` times
+def measure(function, count=OPERATIONS):
+    times = []
+    for _ in range(count):
+        start = time.perf_counter()
+        function()
+        times.append((time.perf_counter() - start) * 1000)
+    times.sort()
+    return statistics.median(times), times[int(len(times) * 0.95)]
+
+def main(argv=None):
+    sizes = [int(size) for size in (argv if argv is not None else sys.argv[1:])] or SIZES
+    app = QApplication([])
+    folder = tempfile.mkdtemp()
+    os.chdir(folder) # main.py opens expense.db in the current folder
+    import main
+    print(f"{'rows':>9} {'add ms (median/p95)':>22} {'delete ms (median/p95)':>24} {'reload ms':>10} "
+          f"{'month ms':>9} {'month+category ms':>18}")
+    for size in sizes:
+        fullname = os.path.join(folder, f"expenses_{size}.db")
+        make_database(fullname, size)
+        main.database.close()
+        main.database.setDatabaseName(fullname)
+        main.database.open()
+        main.create_tables() # indexes, as when the app opens the file
+        window = main.ExpenseApp()
+        window.model.fetchMore() # what the view reads when the window opens
+
+        add = measure(lambda: window.insert_expense("2024-01-01", "Food", "9.99", "benchmark"))
+        delete = measure(lambda: window.remove_expense(0))
+        reload = measure(lambda: (window.load_table(), window.model.fetchMore()), count=20)
+
+        # a different month each time, so nothing is answered from what was read before
+        months = iter(QDate(2010 + number // 12 % 16, number % 12 + 1, 1) for number in range(1000))
+        def show_month():
+            month = next(months)
+            window.from_date.setDate(month)
+            window.to_date.setDate(month.addMonths(1).addDays(-1))
+            window.model.fetchMore()
+        window.filter_dates.setChecked(True)
+        month = measure(show_month, count=20)
+        window.filter_category.setCurrentIndex(1)
+        month_category = measure(show_month, count=20)
+        print(f"{size:>9} {add[0]:>10.3f} / {add[1]:<9.3f} {delete[0]:>11.3f} / {delete[1]:<10.3f} {reload[0]:>10.3f} "
+              f"{month[0]:>9.3f} {month_category[0]:>18.3f}")
+        window.deleteLater()
+        os.remove(fullname)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,9 +1,167 @@
 # import libraries
-from PyQt5.QtWidgets import QApplication, QWidget, QLabel, QDateEdit, QComboBox, QPushButton, QTableWidget, QLineEdit, QVBoxLayout, QHBoxLayout, QMessageBox, QTableWidgetItem, QHeaderView
+from PyQt5.QtWidgets import QApplication, QWidget, QLabel, QDateEdit, QComboBox, QPushButton, QTableView, QLineEdit, QVBoxLayout, QHBoxLayout, QMessageBox, QHeaderView, QAbstractItemView, QCheckBox
+from PyQt5.QtGui import QDoubleValidator
 from PyQt5.QtSql import QSqlDatabase, QSqlQuery
-from PyQt5.QtCore import QDate, Qt
+from PyQt5.QtCore import QDate, Qt, QAbstractTableModel, QModelIndex
 import sys
 
+# expense categories, for adding and for filtering
+categories = ["Food","Transportation","Rent","Shopping","Entertainment","Bills","Others"]
+
+# how many expenses are read from the database at a time as the table scrolls
+PAGE_SIZE = 256
+
+# Table Model Class
+# Reads the expenses a page at a time, only when the view scrolls far enough to need them,
+# so opening the app costs the same however long the history is. Filtering and sorting are
+# done by the database (WHERE / ORDER BY, helped by the indexes on date and category, date).
+# Pages continue from the last row read (its sort value and id) rather than using OFFSET,
+# so late pages are as quick as the first.
+class ExpenseModel(QAbstractTableModel):
+    columns = ["Id", "Date", "Category", "Amount", "Description"]
+    fields = ["id", "date", "category", "amount", "description"]
+
+    def __init__(self):
+        super().__init__()
+        self.rows = [] # (id, date, category, amount, description) read so far
+        self.all_read = False
+        self.filters = [] # (SQL condition, values to bind) the rows must all meet
+        self.sort_column = 1 # newest date first
+        self.descending = True
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.columns)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole or not index.isValid():
+            return None
+        value = self.rows[index.row()][index.column()]
+        return "" if value is None else str(value)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.columns[section]
+        return super().headerData(section, orientation, role)
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self.all_read
+
+    # the filters as a WHERE clause (with more conditions added) and its values
+    def where(self, conditions=(), values=()):
+        conditions = [condition for condition, _ in self.filters] + list(conditions)
+        values = [value for _, filter_values in self.filters for value in filter_values] + list(values)
+        return (" WHERE " + " AND ".join(f"({condition})" for condition in conditions) if conditions else ""), values
+
+    # the condition for rows that come after the last one read, in the current order
+    # (SQLite puts NULL first going up and last going down, and NULL never compares)
+    def after_last(self):
+        if not self.rows:
+            return [], []
+        last = self.rows[-1]
+        field, value, expense_id = self.fields[self.sort_column], last[self.sort_column], last[0]
+        if self.sort_column == 0:
+            return [f"id {'<' if self.descending else '>'} ?"], [expense_id]
+        if value is None:
+            if self.descending:
+                return [f"{field} IS NULL AND id < ?"], [expense_id]
+            return [f"({field} IS NULL AND id > ?) OR {field} IS NOT NULL"], [expense_id]
+        if self.descending:
+            return [f"({field}, id) < (?, ?) OR {field} IS NULL"], [value, expense_id]
+        return [f"({field}, id) > (?, ?)"], [value, expense_id]
+
+    def order_by(self):
+        direction = "DESC" if self.descending else "ASC"
+        if self.sort_column == 0:
+            return f" ORDER BY id {direction}"
+        return f" ORDER BY {self.fields[self.sort_column]} {direction}, id {direction}"
+
+    def read_rows(self, sql, values):
+        query = QSqlQuery()
+        query.prepare(sql)
+        for value in values:
+            query.addBindValue(value)
+        query.exec_()
+        rows = []
+        while query.next(): # (value() gives "" for NULL, so isNull() tells them apart)
+            rows.append(tuple(None if query.isNull(column) else query.value(column) for column in range(len(self.columns))))
+        return rows
+
+    # read the next page and add it to the end of the table
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid():
+            return
+        where, values = self.where(*self.after_last())
+        page = self.read_rows("SELECT id, date, category, amount, description FROM expenses"
+                              + where + self.order_by() + " LIMIT ?", values + [PAGE_SIZE])
+        if len(page) < PAGE_SIZE:
+            self.all_read = True
+        if page:
+            self.beginInsertRows(QModelIndex(), len(self.rows), len(self.rows) + len(page) - 1)
+            self.rows.extend(page)
+            self.endInsertRows()
+
+    # how a row compares in the current order, the way SQLite orders mixed values
+    # (NULL, then numbers, then text), with the id breaking ties
+    def sort_key(self, row):
+        value = row[self.sort_column]
+        rank = 0 if value is None else 2 if isinstance(value, str) else 1
+        return (rank, value if value is not None else 0, row[0])
+
+    # where a row goes among the rows read so far
+    def position(self, row):
+        key = self.sort_key(row)
+        low, high = 0, len(self.rows)
+        while low < high:
+            middle = (low + high) // 2
+            other = self.sort_key(self.rows[middle])
+            if (other > key) if self.descending else (other < key):
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    # show a newly added expense where it belongs, if it passes the filters; past the
+    # rows read so far it is left for a later page to bring in
+    def add_row(self, expense_id):
+        where, values = self.where(["id = ?"], [expense_id])
+        rows = self.read_rows("SELECT id, date, category, amount, description FROM expenses" + where, values)
+        if not rows:
+            return
+        row = self.position(rows[0])
+        if row == len(self.rows) and not self.all_read:
+            return
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.rows.insert(row, rows[0])
+        self.endInsertRows()
+
+    def remove_row(self, row):
+        self.beginRemoveRows(QModelIndex(), row, row)
+        del self.rows[row]
+        self.endRemoveRows()
+
+    # called by the view when a column header is clicked
+    def sort(self, column, order=Qt.AscendingOrder):
+        self.sort_column = column
+        self.descending = order == Qt.DescendingOrder
+        self.reload()
+
+    def set_filters(self, filters):
+        self.filters = filters
+        self.reload()
+
+    # forget what was read; the view asks for the first page again
+    def reload(self):
+        self.beginResetModel()
+        self.rows = []
+        self.all_read = False
+        self.endResetModel()
+
+    def expense_id(self, row):
+        return self.rows[row][0]
+
 # App Class
 class ExpenseApp(QWidget):
     def __init__(self):
@@ -25,14 +183,37 @@ class ExpenseApp(QWidget):
         self.add_button.clicked.connect(self.add_expense)
         self.delete_button.clicked.connect(self.delete_expense)
         
-        self.table = QTableWidget()
-        self.table.setColumnCount(5) #id, date, category, amount, description
-        self.table.setHorizontalHeaderLabels(["Id", "Date", "Category", "Amount", "Description"])
+        self.model = ExpenseModel() #id, date, category, amount, description
+        self.table = QTableView()
+        self.table.setModel(self.model)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
         self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch) # remove the scrolling bar on the table
-        # sort table in descending order
+        # sort table in descending order (clicking a header sorts again, in the database)
+        self.table.setSortingEnabled(True)
         self.table.sortByColumn(1, Qt.DescendingOrder)
         
-        self.dropdown.addItems(["Food","Transportation","Rent","Shopping","Entertainment","Bills","Others"])
+        self.dropdown.addItems(categories)
+        
+        # filter objects: a date range (this month to start with), a category and an amount range
+        today = QDate.currentDate()
+        self.filter_dates = QCheckBox("From:")
+        self.from_date = QDateEdit(QDate(today.year(), today.month(), 1))
+        self.to_date = QDateEdit(QDate(today.year(), today.month(), today.daysInMonth()))
+        self.filter_category = QComboBox()
+        self.filter_category.addItems(["All categories"] + categories)
+        self.min_amount = QLineEdit()
+        self.min_amount.setPlaceholderText("Min amount")
+        self.min_amount.setValidator(QDoubleValidator())
+        self.max_amount = QLineEdit()
+        self.max_amount.setPlaceholderText("Max amount")
+        self.max_amount.setValidator(QDoubleValidator())
+        # filter again whenever one of them changes
+        self.filter_dates.toggled.connect(self.apply_filters)
+        self.from_date.dateChanged.connect(self.apply_filters)
+        self.to_date.dateChanged.connect(self.apply_filters)
+        self.filter_category.currentIndexChanged.connect(self.apply_filters)
+        self.min_amount.textChanged.connect(self.apply_filters)
+        self.max_amount.textChanged.connect(self.apply_filters)
         
         # add CSS style to the table
         self.setStyleSheet("""
@@ -52,7 +233,7 @@ class ExpenseApp(QWidget):
                                padding; 5px;
                            }
                            
-                           QTableWidget{
+                           QTableView{
                                background-color: #b8c9e1;
                                color: #333;
                                border: 1px solid #444;
@@ -77,6 +258,7 @@ class ExpenseApp(QWidget):
         self.row1 = QHBoxLayout()
         self.row2 = QHBoxLayout()
         self.row3 = QHBoxLayout()
+        self.row4 = QHBoxLayout()
         
         # add text and design based on layout
         self.row1.addWidget(QLabel("Date:"))
@@ -92,10 +274,19 @@ class ExpenseApp(QWidget):
         self.row3.addWidget(self.add_button)
         self.row3.addWidget(self.delete_button)
         
+        self.row4.addWidget(self.filter_dates)
+        self.row4.addWidget(self.from_date)
+        self.row4.addWidget(QLabel("to"))
+        self.row4.addWidget(self.to_date)
+        self.row4.addWidget(self.filter_category)
+        self.row4.addWidget(self.min_amount)
+        self.row4.addWidget(self.max_amount)
+        
         # add rows to the master layout
         self.master_layout.addLayout(self.row1)
         self.master_layout.addLayout(self.row2)
         self.master_layout.addLayout(self.row3)
+        self.master_layout.addLayout(self.row4)
         
         # add the table design
         self.master_layout.addWidget(self.table)
@@ -105,30 +296,26 @@ class ExpenseApp(QWidget):
         
         self.load_table()
         
+    # the model reads the rows itself, a page at a time as the table needs them
     def load_table(self):
-        self.table.setRowCount(0)
-        
-        query = QSqlQuery("SELECT * FROM expenses")
-        row = 0
-        while query.next():
-            expense_id = query.value(0)
-            date = query.value(1)
-            category = query.value(2)
-            amount = query.value(3)
-            description = query.value(4)
-            
-            # Add the values to the Table
-            self.table.insertRow(row)
-            
-            # Take the values from the Database and insert it to column within the table
-            self.table.setItem(row, 0,QTableWidgetItem(str(expense_id)))
-            self.table.setItem(row, 1,QTableWidgetItem(date))
-            self.table.setItem(row, 2,QTableWidgetItem(category))
-            self.table.setItem(row, 3,QTableWidgetItem(str(amount)))
-            self.table.setItem(row, 4,QTableWidgetItem(description))
-            
-            # create a counter for the database
-            row += 1
+        self.model.reload()
+
+    # show only the expenses that pass the filter controls; the database does the filtering
+    def apply_filters(self):
+        filters = []
+        if self.filter_dates.isChecked():
+            filters.append(("date BETWEEN ? AND ?", [self.from_date.date().toString("yyyy-MM-dd"),
+                                                     self.to_date.date().toString("yyyy-MM-dd")]))
+        if self.filter_category.currentIndex() > 0:
+            filters.append(("category = ?", [self.filter_category.currentText()]))
+        # (amounts left empty are stored as text, which SQLite sorts above every number)
+        for box, condition in ((self.min_amount, "amount >= ? AND typeof(amount) IN ('integer', 'real')"),
+                               (self.max_amount, "amount <= ?")):
+            try:
+                filters.append((condition, [float(box.text())]))
+            except ValueError: # empty (or only "-" so far): no limit
+                pass
+        self.model.set_filters(filters)
 
     # Add Expense function
     def add_expense(self):
@@ -138,6 +325,16 @@ class ExpenseApp(QWidget):
         description = self.description.text()
         # pass # retrieve all input fields
         
+        self.insert_expense(date, category, amount, description)
+        
+        # clear all the fields
+        self.date_box.setDate(QDate.currentDate())
+        self.dropdown.setCurrentIndex(0)
+        self.amount.clear()
+        self.description.clear()
+        
+    # save an expense and add just that row to the table, returning its id
+    def insert_expense(self, date, category, amount, description):
         # prepare the INSERT QUERY Database
         query = QSqlQuery()
         query.prepare("""
@@ -151,35 +348,32 @@ class ExpenseApp(QWidget):
         query.addBindValue(description)
         query.exec_()
         
-        # clear all the fields
-        self.date_box.setDate(QDate.currentDate())
-        self.dropdown.setCurrentIndex(0)
-        self.amount.clear()
-        self.description.clear()
-        
-        # load the new Database
-        self.load_table()
+        # the id the database gave the new row
+        expense_id = query.lastInsertId()
+        self.model.add_row(expense_id)
+        return expense_id
         
     def delete_expense(self):
-        selected_row = self.table.currentRow()
+        selected_row = self.table.currentIndex().row()
         if selected_row == -1: # if no row was not chosen from the table
             QMessageBox.warning(self, "No Expense Chosen", "Please chose an expense to delete!")
             return
         
-        # if chosen a row, below code would capture the id from that row
-        expense_id = int(self.table.item(selected_row, 0).text())
-        
         # double check if the user want to delete the item
         confirm = QMessageBox.question(self, "Are you sure ?", "Do you want to Delete an expense ?", QMessageBox.Yes | QMessageBox.No)
         if confirm == QMessageBox.No:
             return
         
+        self.remove_expense(selected_row)
+        
+    # delete the expense on a table row from the database, and just that row from the table
+    def remove_expense(self, row):
         query = QSqlQuery()
         query.prepare("DELETE FROM expenses WHERE id = ?")
-        query.addBindValue(expense_id)
+        query.addBindValue(self.model.expense_id(row))
         query.exec_()
         
-        self.load_table()
+        self.model.remove_row(row)
 
 # create Database
 database = QSqlDatabase.addDatabase("QSQLITE")
@@ -188,20 +382,25 @@ if not database.open():
     QMessageBox.critical(None, "Error", "Could not open your Database")
     sys.exit(1)
     
-# create a Database query
-query = QSqlQuery()
-query.exec_("""
-            CREATE TABLE IF NOT EXISTS expenses (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                date TEXT,
-                category TEXT,
-                amount REAL,
-                description TEXT
-            )
-            """)
+# create the table, and the indexes that make date ranges, categories and sorting by date quick
+def create_tables():
+    query = QSqlQuery()
+    query.exec_("""
+                CREATE TABLE IF NOT EXISTS expenses (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    date TEXT,
+                    category TEXT,
+                    amount REAL,
+                    description TEXT
+                )
+                """)
+    query.exec_("CREATE INDEX IF NOT EXISTS expenses_date ON expenses (date)")
+    query.exec_("CREATE INDEX IF NOT EXISTS expenses_category_date ON expenses (category, date)")
+
+create_tables()
         
 # run the quiz_app
-if __name__ in "__main__":
+if __name__ == "__main__":
     app = QApplication([])
     main = ExpenseApp()
     main.show()
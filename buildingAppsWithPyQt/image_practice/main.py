@@ -1,21 +1,131 @@
+# Make gray, mirror, blur, contrast and color renditions of pictures. Each picture is decoded
+# once and every rendition is made from that same copy on a thread pool.
+# run with: python main.py [PICTURE ...] [--variants gray,blur] [--format png,jpeg] [--quality 85]
+#                          [--contrast 2.5] [--color 2.5] [--output FOLDER]
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image, ImageFilter, ImageEnhance
 
-with Image.open('/Users/balogunishaq/Desktop/Python Zero to Knowing Tutorial/buildingAppsWithPyQt/image_practice/customers.png') as picture:
-    # picture.show()
-    
-    black_white = picture.convert("L")
-    black_white.save("gray.png")
-    
-    mirror = picture.transpose(Image.FLIP_LEFT_RIGHT)
-    mirror.save("mirror.png")
-    
-    blur = picture.filter(ImageFilter.BLUR)
-    blur.save("blur.png")
-    
-    # Image Enhance
-    contrast = ImageEnhance.Contrast(picture)
-    contrast = contrast.enhance(2.5)
-    contrast.save("contrast.png")
-    
-    color = ImageEnhance.Color(picture).enhance(2.5)
-    color.save("color.png")
\ No newline at end of file
+try:
+    import resource
+except ImportError: # Windows
+    resource = None
+
+DEFAULT_PICTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "customers.png")
+
+# every rendition, given the decoded picture and the options
+variants = {
+    "gray": lambda picture, options: picture.convert("L"),
+    "mirror": lambda picture, options: picture.transpose(Image.FLIP_LEFT_RIGHT),
+    "blur": lambda picture, options: picture.filter(ImageFilter.BLUR),
+    "contrast": lambda picture, options: ImageEnhance.Contrast(picture).enhance(options.contrast),
+    "color": lambda picture, options: ImageEnhance.Color(picture).enhance(options.color),
+}
+
+# file extension and PIL format for each output format
+formats = {"png": (".png", "PNG"), "jpeg": (".jpg", "JPEG"), "webp": (".webp", "WEBP")}
+
+# peak memory of this process so far, in MB (None where it can't be read)
+def peak_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+# JPEG has no transparency, so that goes onto white
+def for_format(image, image_format):
+    if image_format != "JPEG" or image.mode in ("RGB", "L"):
+        return image
+    image = image.convert("RGBA")
+    background = Image.new("RGB", image.size, "white")
+    background.paste(image, mask=image.getchannel("A"))
+    return background
+
+# runs on the thread pool: make one rendition and save it in every format, timing each part
+def make_variant(picture, name, targets, options):
+    start = time.perf_counter()
+    image = variants[name](picture, options)
+    filtered = time.perf_counter()
+    for target, image_format in targets:
+        params = {} if image_format == "PNG" else {"quality": options.quality}
+        for_format(image, image_format).save(target, image_format, **params)
+    saved = time.perf_counter()
+    return name, filtered - start, saved - filtered
+
+# make every rendition of one picture, returning how many of them failed
+def make_variants(source, options, pool):
+    stem = os.path.splitext(os.path.basename(source))[0]
+    start = time.perf_counter()
+    with Image.open(source) as picture:
+        picture.load() # decoded once, shared by every rendition
+    if picture.mode not in ("RGB", "RGBA", "L"): # palette, 16-bit, CMYK, ...: blur and contrast need one of these
+        picture = picture.convert("RGBA" if "A" in picture.mode or "transparency" in picture.info else "RGB")
+    decoded = time.perf_counter()
+    print(f"{source}: {picture.width}x{picture.height} {picture.mode}, decoded in {(decoded - start) * 1000:.1f} ms")
+
+    jobs = []
+    for name in options.variants:
+        filename = options.name.format(stem=stem, variant=name)
+        targets = [(os.path.join(options.output, filename + formats[output][0]), formats[output][1])
+                   for output in options.formats]
+        jobs.append(pool.submit(make_variant, picture, name, targets, options))
+    failed = 0
+    for name, job in zip(options.variants, jobs):
+        try:
+            name, filter_seconds, save_seconds = job.result()
+        except Exception as error:
+            failed += 1
+            print(f"  {name}: failed: {error}", file=sys.stderr)
+            continue
+        print(f"  {name}: {filter_seconds * 1000:.1f} ms to make, {save_seconds * 1000:.1f} ms to save")
+    peak = peak_mb()
+    print(f"  all variants in {(time.perf_counter() - decoded) * 1000:.1f} ms, peak memory so far "
+          + (f"{peak:.0f} MB" if peak is not None else "unavailable"))
+    return failed
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Make renditions of pictures from a single decode of each.")
+    parser.add_argument("pictures", nargs="*", default=[DEFAULT_PICTURE], help="pictures to use (default: customers.png)")
+    parser.add_argument("--variants", default=",".join(variants),
+                        help="comma separated renditions to make (default: all of " + ", ".join(variants) + ")")
+    parser.add_argument("--format", default="png", help="comma separated output formats: png, jpeg, webp (default: png)")
+    parser.add_argument("--quality", type=int, default=85, help="JPEG/WebP quality (default: 85)")
+    parser.add_argument("--contrast", type=float, default=2.5, help="contrast enhance factor (default: 2.5)")
+    parser.add_argument("--color", type=float, default=2.5, help="color enhance factor (default: 2.5)")
+    parser.add_argument("--output", default=".", help="folder to write to (default: the current folder)")
+    parser.add_argument("--name", help="output file name without extension, from {stem} and {variant} "
+                                       "(default: {variant} for one picture, {stem}_{variant} for more)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="threads making renditions at once")
+    options = parser.parse_args(argv)
+    options.variants = [name.strip() for name in options.variants.split(",") if name.strip()]
+    unknown = [name for name in options.variants if name not in variants]
+    if unknown:
+        parser.error("unknown variant(s): " + ", ".join(unknown))
+    options.formats = [name.strip().lower() for name in options.format.split(",") if name.strip()]
+    unknown = [name for name in options.formats if name not in formats]
+    if unknown:
+        parser.error("unknown format(s): " + ", ".join(unknown))
+    if options.name is None:
+        options.name = "{variant}" if len(options.pictures) == 1 else "{stem}_{variant}"
+    return options
+
+def main(argv=None):
+    options = parse_args(argv)
+    os.makedirs(options.output, exist_ok=True)
+    failed = 0
+    with ThreadPoolExecutor(options.workers) as pool: # PIL lets go of the GIL while filtering and encoding
+        for source in options.pictures:
+            try:
+                failed += make_variants(source, options, pool)
+            except Exception as error: # can't be opened: the other pictures still get done
+                failed += 1
+                print(f"{source}: failed: {error}", file=sys.stderr)
+    if failed:
+        print(f"{failed} failed.", file=sys.stderr)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())